@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+Shared pieces of the AR Game static servers
+Used by start-server.py, start-https-server.py and start-https-simple.py
+"""
+
+import http.server
+import datetime
+import email.utils
+import errno
+import gzip
+import io
+import webbrowser
+import os
+import sys
+import subprocess
+import signal
+import stat
+import threading
+import time
+import ssl
+from http import HTTPStatus
+
+# Binds tried (clearing the port in between) before giving up
+BIND_ATTEMPTS = 3
+# Precompressed variants written by precompress.py, in order of preference
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+# Files up to this size are kept in memory after their first request...
+FILE_CACHE_MAX_SIZE = 4 * 1024 * 1024
+# ...until the cache holds this many bytes
+FILE_CACHE_BUDGET = 64 * 1024 * 1024
+# Assets worth compressing: precompress.py writes .br/.gz for them and the servers
+# gzip them on the fly when it hasn't. .glb is left out: the models embed already
+# compressed textures, and gzip saves ~2% on treasure_chest.glb.
+COMPRESSIBLE_EXTENSIONS = ('.js', '.json', '.gltf', '.html', '.css', '.svg', '.wasm')
+# Smaller files aren't worth an extra Content-Encoding round of work
+COMPRESS_MIN_SIZE = 1024
+# AEAD ciphers with forward secrecy only (applies to TLS 1.2; 1.3 suites are fixed)
+SSL_CIPHERS = 'ECDHE+AESGCM:ECDHE+CHACHA20'
+
+def _accepted_encodings(header):
+    """Return the content codings an Accept-Encoding header allows (q > 0)"""
+    accepted, refused = set(), set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (accepted if q > 0 else refused).add(coding)
+    if '*' in accepted:
+        # "*" covers every coding not listed on its own
+        accepted.update(name for name, _ in PRECOMPRESSED if name not in refused)
+    return accepted
+
+class ARHTTPServer(http.server.ThreadingHTTPServer):
+    # listen() backlog; the default of 5 drops SYNs when a page fetches assets in parallel
+    request_queue_size = 128
+    # Set to serve HTTPS; connections are wrapped after accept()
+    ssl_context = None
+
+    def get_request(self):
+        sock, addr = self.socket.accept()
+        if self.ssl_context is not None:
+            # Defer the handshake to the connection's worker thread so a slow
+            # client doesn't hold up accept() for everyone else
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, addr
+
+class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # Set TCP_NODELAY in setup() so small responses aren't held back by Nagle
+    disable_nagle_algorithm = True
+    # Keep connections open between requests so assets share one TLS handshake;
+    # idle keep-alive connections are dropped after `timeout` seconds
+    protocol_version = 'HTTP/1.1'
+    timeout = 30
+
+    # CORS headers for AR.js, encoded once
+    _CORS_HEADERS = (b"Access-Control-Allow-Origin: *\r\n"
+                     b"Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+                     b"Access-Control-Allow-Headers: Content-Type\r\n")
+    # path (or (path, 'gzip')) -> ((mtime_ns, size), body) of small files, shared by all connections
+    _file_cache = {}
+    _file_cache_size = 0
+    _file_cache_lock = threading.Lock()
+
+    # Content types for the asset set, looked up directly instead of via mimetypes
+    EXT_MAP = {
+        '.html': 'text/html; charset=utf-8',
+        '.js': 'text/javascript; charset=utf-8',
+        '.mjs': 'text/javascript; charset=utf-8',
+        '.css': 'text/css; charset=utf-8',
+        '.json': 'application/json',
+        '.wasm': 'application/wasm',
+        '.glb': 'model/gltf-binary',
+        '.gltf': 'model/gltf+json',
+        '.patt': 'text/plain',
+        '.png': 'image/png',
+        '.jpg': 'image/jpeg',
+        '.jpeg': 'image/jpeg',
+        '.gif': 'image/gif',
+        '.svg': 'image/svg+xml',
+        '.mp4': 'video/mp4',
+        '.webm': 'video/webm',
+    }
+
+    def guess_type(self, path):
+        content_type = self.EXT_MAP.get(os.path.splitext(path)[1].lower())
+        if content_type is None:
+            return super().guess_type(path)
+        return content_type
+
+    def handle(self):
+        if isinstance(self.connection, ssl.SSLSocket):
+            try:
+                self.connection.do_handshake()
+            except (ssl.SSLError, OSError):
+                # e.g. the browser rejecting the self-signed certificate
+                return
+        super().handle()
+
+    def end_headers(self):
+        # Goes into send_header's buffer so it follows the status line; there is
+        # no buffer when replying to an HTTP/0.9 request, which gets no headers
+        if hasattr(self, '_headers_buffer'):
+            self._headers_buffer.append(self._CORS_HEADERS)
+        super().end_headers()
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is not None and stat.S_ISDIR(st.st_mode) and path.endswith('/'):
+            # Serve the directory's index page (e.g. GET /) through the same cached path
+            for index in ('index.html', 'index.htm'):
+                try:
+                    index_st = os.stat(path + index)
+                except OSError:
+                    continue
+                if stat.S_ISREG(index_st.st_mode):
+                    path, st = path + index, index_st
+                    break
+        if st is None or not stat.S_ISREG(st.st_mode):
+            # Directory listings, redirects and 404s
+            return super().send_head()
+
+        # Send foo.js.br / foo.js.gz instead of foo.js when the client accepts it
+        body_path, body_st, encoding = path, st, None
+        accept = _accepted_encodings(self.headers.get('Accept-Encoding', ''))
+        for name, suffix in PRECOMPRESSED:
+            if name in accept:
+                try:
+                    variant_st = os.stat(path + suffix)
+                except OSError:
+                    continue
+                if variant_st.st_mtime >= st.st_mtime:
+                    body_path, body_st, encoding = path + suffix, variant_st, name
+                    break
+        else:
+            # No file on disk: gzip text assets in memory, once per version
+            if ('gzip' in accept and path.endswith(COMPRESSIBLE_EXTENSIONS)
+                    and COMPRESS_MIN_SIZE <= st.st_size <= FILE_CACHE_MAX_SIZE):
+                body_path, encoding = None, 'gzip'
+
+        # Per body file, so the .br/.gz variants get their own tags
+        etag = f'"{body_st.st_ino:x}-{body_st.st_mtime_ns:x}-{body_st.st_size:x}"'
+        if body_path is None:
+            etag = etag[:-1] + '-gz"'
+        if self._etag_matches(etag) or self._not_modified(st):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self._send_cache_control(path)
+            if encoding:
+                self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return None
+
+        try:
+            if body_path is None:
+                body, length = self._gzip_body(path, st)
+            else:
+                body, length = self._open_body(body_path, body_st)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        self.send_response(HTTPStatus.OK)
+        # Content-Type comes from the original name, not the .br/.gz one
+        self.send_header('Content-Type', self.guess_type(path))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Last-Modified', self.date_time_string(st.st_mtime))
+        self.send_header('ETag', etag)
+        self._send_cache_control(path)
+        self.end_headers()
+        return body
+
+    def _send_cache_control(self, path):
+        # Let browsers reuse models/scripts/textures; pages stay uncached so edits show up
+        if not path.endswith('.html'):
+            self.send_header('Cache-Control', 'public, max-age=3600')
+
+    def _etag_matches(self, etag):
+        """True if the request's If-None-Match lists etag (weak comparison)"""
+        header = self.headers.get('If-None-Match')
+        if not header:
+            return False
+        tags = [tag.strip() for tag in header.split(',')]
+        return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+    def _not_modified(self, st):
+        """True if the request's If-Modified-Since covers st (as SimpleHTTPRequestHandler does)"""
+        if 'If-Modified-Since' not in self.headers or 'If-None-Match' in self.headers:
+            return False
+        try:
+            ims = email.utils.parsedate_to_datetime(self.headers['If-Modified-Since'])
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if ims.tzinfo is None:
+            ims = ims.replace(tzinfo=datetime.timezone.utc)
+        if ims.tzinfo is not datetime.timezone.utc:
+            return False
+        last_modified = datetime.datetime.fromtimestamp(st.st_mtime, datetime.timezone.utc)
+        return last_modified.replace(microsecond=0) <= ims
+
+    @classmethod
+    def _open_body(cls, path, st):
+        """Return (file object, length) for path, from memory when cached"""
+        key = (st.st_mtime_ns, st.st_size)
+        cached = cls._file_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return io.BytesIO(cached[1]), len(cached[1])
+
+        f = open(path, 'rb')
+        if st.st_size > FILE_CACHE_MAX_SIZE:
+            return f, os.fstat(f.fileno()).st_size
+        with f:
+            data = f.read()
+        cls._cache_put(path, key, data)
+        return io.BytesIO(data), len(data)
+
+    @classmethod
+    def _gzip_body(cls, path, st):
+        """Return (file object, length) for the gzipped contents of path"""
+        key = (st.st_mtime_ns, st.st_size)
+        cached = cls._file_cache.get((path, 'gzip'))
+        if cached is not None and cached[0] == key:
+            return io.BytesIO(cached[1]), len(cached[1])
+
+        with open(path, 'rb') as f:
+            data = gzip.compress(f.read(), compresslevel=6)
+        cls._cache_put((path, 'gzip'), key, data)
+        return io.BytesIO(data), len(data)
+
+    @classmethod
+    def _cache_put(cls, cache_key, key, data):
+        with cls._file_cache_lock:
+            old = cls._file_cache.pop(cache_key, None)
+            if old is not None:
+                cls._file_cache_size -= len(old[1])
+            if cls._file_cache_size + len(data) <= FILE_CACHE_BUDGET:
+                cls._file_cache[cache_key] = (key, data)
+                cls._file_cache_size += len(data)
+
+    def copyfile(self, source, outputfile):
+        if isinstance(source, io.BytesIO):
+            # Cached body: one write straight from memory
+            outputfile.write(source.getbuffer())
+            return
+        # sendfile(2) copies file to socket in the kernel; TLS has to encrypt in userspace
+        if isinstance(self.connection, ssl.SSLSocket):
+            return super().copyfile(source, outputfile)
+        self.wfile.flush()
+        self.connection.sendfile(source)
+
+def kill_port_processes(port):
+    """Kill any processes using the specified port"""
+    try:
+        import psutil
+        connections = psutil.net_connections(kind='inet')
+    except ImportError:
+        return _kill_port_processes_lsof(port)
+    except psutil.AccessDenied:
+        # macOS only lists other users' sockets to root
+        return _kill_port_processes_lsof(port)
+
+    pids = {c.pid for c in connections
+            if c.laddr and c.laddr.port == port and c.status == psutil.CONN_LISTEN and c.pid}
+    pids.discard(os.getpid())
+    if not pids:
+        print(f"✅ Port {port} is free")
+        return
+
+    print(f"🔍 Found {len(pids)} process(es) using port {port}")
+    # Signal everything first, then wait for all of them together
+    processes = []
+    for pid in pids:
+        try:
+            print(f"🔄 Killing process {pid}...")
+            process = psutil.Process(pid)
+            process.terminate()
+            processes.append(process)
+        except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+            print(f"⚠️  Could not kill process {pid}: {e}")
+
+    gone, alive = psutil.wait_procs(processes, timeout=1)
+    for process in gone:
+        print(f"✅ Process {process.pid} terminated successfully")
+    for process in alive:
+        try:
+            print(f"⚡ Force killing process {process.pid}...")
+            process.kill()
+        except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+            print(f"⚠️  Could not kill process {process.pid}: {e}")
+
+    print(f"✅ Cleaned up port {port}")
+
+def _wait_for_exit(pids, timeout=1.0, interval=0.02):
+    """Poll until the pids have exited; returns the set still running after timeout"""
+    remaining = set(pids)
+    deadline = time.monotonic() + timeout
+    while True:
+        for pid in list(remaining):
+            try:
+                os.kill(pid, 0)  # Check if process exists
+            except ProcessLookupError:
+                remaining.discard(pid)
+                print(f"✅ Process {pid} terminated successfully")
+        if not remaining or time.monotonic() >= deadline:
+            return remaining
+        time.sleep(interval)
+
+def _kill_port_processes_lsof(port):
+    """Kill any processes using the specified port, found via lsof"""
+    try:
+        # Find processes using the port
+        result = subprocess.run(['lsof', '-ti', f':{port}'],
+                              capture_output=True, text=True)
+
+        if result.returncode == 0 and result.stdout.strip():
+            pids = result.stdout.strip().split('\n')
+            print(f"🔍 Found {len(pids)} process(es) using port {port}")
+
+            # Signal everything first, then wait for all of them together
+            signalled = []
+            for pid in pids:
+                if pid.strip():
+                    try:
+                        print(f"🔄 Killing process {pid}...")
+                        os.kill(int(pid), signal.SIGTERM)
+                        signalled.append(int(pid))
+                    except (ValueError, ProcessLookupError, PermissionError) as e:
+                        print(f"⚠️  Could not kill process {pid}: {e}")
+
+            # Force kill whatever hasn't exited within a second
+            for pid in _wait_for_exit(signalled):
+                try:
+                    print(f"⚡ Force killing process {pid}...")
+                    os.kill(pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError) as e:
+                    print(f"⚠️  Could not kill process {pid}: {e}")
+
+            print(f"✅ Cleaned up port {port}")
+        else:
+            print(f"✅ Port {port} is free")
+
+    except FileNotFoundError:
+        print("⚠️  lsof command not found, trying alternative method...")
+        # Alternative method for systems without lsof
+        try:
+            result = subprocess.run(['netstat', '-tulpn'], capture_output=True, text=True)
+            if f':{port}' in result.stdout:
+                print(f"⚠️  Port {port} appears to be in use, but cannot kill processes automatically")
+                print("💡 Please manually stop any server running on this port")
+        except FileNotFoundError:
+            print("⚠️  Cannot check port status automatically")
+
+def print_banner(lines):
+    # One write for the whole banner
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+def can_open_browser():
+    """True when run interactively on a machine with a display and NO_BROWSER unset"""
+    if os.environ.get('NO_BROWSER') or not sys.stdout.isatty():
+        return False
+    return sys.platform in ('darwin', 'win32') or 'DISPLAY' in os.environ or 'WAYLAND_DISPLAY' in os.environ
+
+def open_browser(url):
+    # Try to open browser automatically
+    if not can_open_browser():
+        return
+    try:
+        webbrowser.open(url)
+        print("🌐 Browser opened automatically")
+    except:
+        print("⚠️  Could not open browser automatically")
+
+def create_ssl_context(cert_file, key_file):
+    """Build the server TLS context"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.set_ciphers(SSL_CIPHERS)
+    context.options |= ssl.OP_NO_COMPRESSION
+    # Session tickets let returning browsers resume without a full handshake
+    context.options &= ~ssl.OP_NO_TICKET
+    context.num_tickets = 2
+    return context
+
+def bind_server(port, attempts=BIND_ATTEMPTS):
+    """Bind the server to port, stopping whatever holds it only if the port is taken"""
+    for attempt in range(attempts):
+        try:
+            return ARHTTPServer(("0.0.0.0", port), MyHTTPRequestHandler)
+        except OSError as e:
+            # EADDRINUSE is 48 on macOS, 98 on Linux
+            if e.errno != errno.EADDRINUSE or attempt == attempts - 1:
+                raise
+
+        print(f"🔍 Port {port} is in use, stopping the process holding it...")
+        kill_port_processes(port)
+        time.sleep(0.2 * (attempt + 1))
+
+def run_server(port, ssl_context=None, banner=(), browser=True):
+    """Serve the current directory on port until interrupted (HTTPS if ssl_context is given)"""
+    with bind_server(port) as httpd:
+        httpd.ssl_context = ssl_context
+        print_banner(banner)
+        if browser:
+            scheme = 'https' if ssl_context is not None else 'http'
+            open_browser(f'{scheme}://localhost:{port}')
+        httpd.serve_forever()
+
+def _build_asgi_app():
+    """Build the Starlette app serving the current directory; raises ImportError if unavailable"""
+    from starlette.applications import Starlette
+    from starlette.middleware import Middleware
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.datastructures import Headers
+    from starlette.middleware.gzip import GZipMiddleware
+    from starlette.routing import Mount
+    from starlette.staticfiles import StaticFiles
+
+    class CachingStaticFiles(StaticFiles):
+        def file_response(self, full_path, stat_result, scope, status_code=200):
+            full_path = str(full_path)
+            # Send foo.js.br / foo.js.gz when the client accepts it, as MyHTTPRequestHandler does
+            body_path, body_st, encoding = full_path, stat_result, None
+            accept = _accepted_encodings(Headers(scope=scope).get('accept-encoding', ''))
+            for name, suffix in PRECOMPRESSED:
+                if name in accept:
+                    try:
+                        variant_st = os.stat(full_path + suffix)
+                    except OSError:
+                        continue
+                    if variant_st.st_mtime >= stat_result.st_mtime:
+                        body_path, body_st, encoding = full_path + suffix, variant_st, name
+                        break
+
+            response = super().file_response(body_path, body_st, scope, status_code)
+            if encoding:
+                response.headers['Vary'] = 'Accept-Encoding'
+                if response.status_code != HTTPStatus.NOT_MODIFIED:
+                    response.headers['Content-Encoding'] = encoding
+                    # Content-Type comes from the original name, not the .br/.gz one
+                    response.headers['Content-Type'] = MyHTTPRequestHandler.EXT_MAP.get(
+                        os.path.splitext(full_path)[1].lower(), response.headers['Content-Type'])
+            # Same caching policy as MyHTTPRequestHandler
+            if not full_path.endswith('.html'):
+                response.headers['Cache-Control'] = 'public, max-age=3600'
+            return response
+
+    class TextGZipMiddleware(GZipMiddleware):
+        async def __call__(self, scope, receive, send):
+            # Models, images and video are already compressed; gzipping them on the
+            # event loop on every request only costs CPU
+            if scope['type'] == 'http' and not scope['path'].endswith(COMPRESSIBLE_EXTENSIONS + ('/',)):
+                await self.app(scope, receive, send)
+                return
+            # GZipMiddleware only checks for the substring, so "gzip;q=0" would still get gzip
+            if scope['type'] == 'http' and 'gzip' not in _accepted_encodings(
+                    Headers(scope=scope).get('accept-encoding', '')):
+                await self.app(scope, receive, send)
+                return
+            await super().__call__(scope, receive, send)
+
+    return Starlette(
+        routes=[Mount('/', app=CachingStaticFiles(directory='.', html=True))],
+        middleware=[
+            Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['GET', 'POST', 'OPTIONS'],
+                       allow_headers=['Content-Type']),
+            # Precompressed responses already carry Content-Encoding and pass through untouched
+            Middleware(TextGZipMiddleware, minimum_size=COMPRESS_MIN_SIZE, compresslevel=6),
+        ],
+    )
+
+def serve_asgi(port, banner=(), cert_file=None, key_file=None):
+    """Serve with uvicorn + Starlette (event loop, no thread per connection) if installed;
+    returns False when they are not
+
+    Shares the cipher list, caching policy and precompressed assets with run_server, but not
+    its in-memory file cache, sendfile or session-ticket settings
+    """
+    try:
+        import uvicorn
+        app = _build_asgi_app()
+    except ImportError:
+        return False
+
+    # Clear any stale server off the port before uvicorn binds it
+    bind_server(port).server_close()
+    print(f"⚡ Serving with uvicorn")
+    print_banner(banner)
+    scheme = 'https' if cert_file else 'http'
+    open_browser(f'{scheme}://localhost:{port}')
+    # loop='auto' picks uvloop and http='auto' picks httptools when installed
+    uvicorn.run(app, host='0.0.0.0', port=port, ssl_certfile=cert_file, ssl_keyfile=key_file,
+                ssl_ciphers=SSL_CIPHERS, log_level='warning')
+    return True
@@ -6,16 +6,181 @@ CRUD operations for user basic information
 
 import os
 import json
+import time
+import atexit
+import threading
+from importlib import import_module
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Any, Union
+from bson import ObjectId
+from bson.codec_options import TypeDecoder, TypeEncoder, TypeRegistry
+from pymongo import MongoClient, ReturnDocument, InsertOne, UpdateOne
+from pymongo.server_api import ServerApi
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bound once so hot paths skip the attribute lookup on datetime
+_utcnow = datetime.utcnow
+
+# Queued game_logs writes are sent together in one bulk_write once this many
+# build up, or LOG_FLUSH_INTERVAL_SECONDS after the first one was queued
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL_SECONDS = 1.0
+
+# Fields every new user document must provide
+_REQUIRED_USER_FIELDS = frozenset({"username", "email", "first_name", "last_name"})
+
+# Documents fetched per round-trip when streaming list results
+CURSOR_BATCH_SIZE = 64
+
+# How long rank results are served from memory
+CACHE_TTL_SECONDS = 5
+
+# Leaderboards are fresh for LEADERBOARD_TTL_SECONDS (or until a write changes
+# standings), then served stale for up to LEADERBOARD_STALE_SECONDS more while a
+# background thread refreshes them
+LEADERBOARD_TTL_SECONDS = 30
+LEADERBOARD_STALE_SECONDS = 30
+
+
+def _available_compressors() -> str:
+    """Wire compressors whose codec packages are installed (zlib is built in)"""
+    compressors = []
+    for name, module in (("zstd", "zstandard"), ("snappy", "snappy")):
+        try:
+            import_module(module)
+        except ImportError:
+            continue
+        compressors.append(name)
+    compressors.append("zlib")
+    return ",".join(compressors)
+
+# Compress list/history results on the wire with the best codec available;
+# naming a codec whose package is missing makes pymongo warn on every connect
+WIRE_COMPRESSORS = _available_compressors()
+
+
+def _stamped_update(update_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a $set update that has the server stamp updated_at"""
+    update = {"$currentDate": {"updated_at": True}}
+    if update_data:
+        update["$set"] = update_data
+    return update
+
+
+class _ObjectIdAsStr(TypeDecoder):
+    """Decode ObjectIds in user documents straight to strings"""
+    bson_type = ObjectId
+    
+    def transform_bson(self, value):
+        return str(value)
+
+
+@dataclass(slots=True)
+class RiddleEvent:
+    """event_data for a riddle_attempt game log"""
+    riddle_id: str
+    location: str
+    is_correct: bool
+    time_taken: float
+    timestamp: datetime = field(default_factory=_utcnow)
+
+
+@dataclass(slots=True)
+class TreasureEvent:
+    """event_data for a treasure_found game log"""
+    treasure_id: str
+    location: str
+    coordinates: Dict[str, float]
+    timestamp: datetime = field(default_factory=_utcnow)
+
+
+class _SlotsEventEncoder(TypeEncoder):
+    """Encode a slots event dataclass as a plain BSON document"""
+    
+    def __init__(self, event_class):
+        self._event_class = event_class
+        self._fields = event_class.__slots__
+    
+    @property
+    def python_type(self):
+        return self._event_class
+    
+    def transform_python(self, value):
+        return {name: getattr(value, name) for name in self._fields}
+
+
+def _riddle_points(time_taken: float) -> int:
+    """Points for a solved riddle; more points for faster solving"""
+    return max(10, 50 - int(time_taken))
+
+
+# Fields read back for leaderboard rows and history entries
+_LEADERBOARD_PROJECTION = {"username": 1, "total_points": 1, "wins": 1, "first_name": 1, "last_name": 1}
+_RIDDLE_PROJECTION = {
+    "_id": 0,
+    "event_data.riddle_id": 1,
+    "event_data.location": 1,
+    "event_data.is_correct": 1,
+    "event_data.time_taken": 1,
+    "timestamp": 1
+}
+_TREASURE_PROJECTION = {
+    "_id": 0,
+    "event_data.treasure_id": 1,
+    "event_data.location": 1,
+    "event_data.coordinates": 1,
+    "timestamp": 1
+}
+
+
+def _leaderboard_entry(rank: int, player: Dict[str, Any]) -> Dict[str, Any]:
+    """Format a user document as a leaderboard row"""
+    return {
+        'rank': rank,
+        'user_id': player['_id'],
+        'username': player.get('username', 'Unknown'),
+        'total_points': player.get('total_points', 0),
+        'wins': player.get('wins', 0),
+        'first_name': player.get('first_name', ''),
+        'last_name': player.get('last_name', '')
+    }
+
+
+def _riddle_entry(log: Dict[str, Any]) -> Dict[str, Any]:
+    """Format a riddle_attempt game log as a history entry"""
+    return {
+        'riddle_id': log.get('event_data', {}).get('riddle_id'),
+        'location': log.get('event_data', {}).get('location'),
+        'is_correct': log.get('event_data', {}).get('is_correct'),
+        'time_taken': log.get('event_data', {}).get('time_taken'),
+        'timestamp': log.get('timestamp')
+    }
+
+
+def _treasure_entry(log: Dict[str, Any]) -> Dict[str, Any]:
+    """Format a treasure_found game log as a history entry"""
+    return {
+        'treasure_id': log.get('event_data', {}).get('treasure_id'),
+        'location': log.get('event_data', {}).get('location'),
+        'coordinates': log.get('event_data', {}).get('coordinates'),
+        'timestamp': log.get('timestamp')
+    }
+
+
+@lru_cache(maxsize=4096)
+def _oid(user_id: str) -> ObjectId:
+    """Convert a user ID string to an ObjectId, memoized for repeat lookups"""
+    return ObjectId(user_id)
+
+
 class UserDatabase:
     def __init__(self, connection_string: str = None, database_name: str = "treasure_hunt_db"):
         """
@@ -29,6 +194,19 @@ class UserDatabase:
         self.client = None
         self.db = None
         self.users_collection = None
+        self.game_logs_collection = None
+        self._pending_ops = []
+        self._pending_lock = threading.Lock()
+        self._flush_timer = None
+        self._lb_cache = {}
+        self._cache_generation = 0
+        self._lb_refreshing = set()
+        self._lb_refreshing_lock = threading.Lock()
+        
+        # Game event inserts run here so callers don't wait on them
+        self._log_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="game-log")
+        # In-flight insert -> the user ObjectId it logs for
+        self._log_futures = {}
         
         # Default connection string (replace with your actual credentials)
         if not connection_string:
@@ -40,19 +218,64 @@ class UserDatabase:
         
         self.connection_string = connection_string
         self.connect()
+        
+        # Drain queued game events on shutdown
+        atexit.register(self.flush)
     
     def connect(self):
         """Establish connection to MongoDB"""
         try:
-            self.client = MongoClient(self.connection_string, serverSelectionTimeoutMS=5000)
+            self.client = MongoClient(
+                self.connection_string,
+                serverSelectionTimeoutMS=5000,
+                connectTimeoutMS=5000,
+                socketTimeoutMS=10000,
+                maxPoolSize=int(os.getenv("MONGO_POOL", "200")),
+                waitQueueTimeoutMS=2000,
+                compressors=WIRE_COMPRESSORS,
+                zlibCompressionLevel=1,
+                # Pin the Stable API so behaviour doesn't shift with server upgrades
+                server_api=ServerApi("1"),
+                retryWrites=True,
+                w="majority",
+                readPreference="primaryPreferred"
+            )
             # Test the connection
             self.client.admin.command('ping')
+            logger.info(f"🗜️ Wire compressors offered: {WIRE_COMPRESSORS}")
             self.db = self.client[self.database_name]
-            self.users_collection = self.db.users
+            # User documents come back with a string _id, ready for the API
+            self.users_collection = self.db.get_collection(
+                "users",
+                codec_options=self.db.codec_options.with_options(
+                    type_registry=TypeRegistry([_ObjectIdAsStr()])
+                )
+            )
+            self.game_logs_collection = self.db.get_collection(
+                "game_logs",
+                codec_options=self.db.codec_options.with_options(
+                    type_registry=TypeRegistry([
+                        _SlotsEventEncoder(RiddleEvent),
+                        _SlotsEventEncoder(TreasureEvent)
+                    ])
+                )
+            )
             
             # Create indexes for better performance
             self.users_collection.create_index("email", unique=True)
             self.users_collection.create_index("username", unique=True)
+            self.users_collection.create_index([("total_points", -1), ("is_active", 1)])
+            # Leaderboard: equality on is_active, then sort, so the top N are read in order
+            self.users_collection.create_index([("is_active", 1), ("total_points", -1)],
+                                               name="lb_points_desc")
+            self.users_collection.create_index(
+                [("is_active", 1)],
+                partialFilterExpression={"is_active": True}
+            )
+            
+            # History queries filter by user and event type, newest first
+            self.game_logs_collection.create_index([("user_id", 1), ("event_type", 1), ("timestamp", -1)])
+            self.game_logs_collection.create_index([("user_id", 1), ("timestamp", -1)])
             
             logger.info("✅ Successfully connected to MongoDB")
             
@@ -65,11 +288,84 @@ class UserDatabase:
     
     def disconnect(self):
         """Close MongoDB connection"""
+        self.flush()
+        # Nothing left to drain at exit, and the instance can be released
+        atexit.unregister(self.flush)
+        self._log_executor.shutdown(wait=True)
         if self.client:
             self.client.close()
             logger.info("🔌 Disconnected from MongoDB")
     
+    @classmethod
+    @lru_cache(maxsize=1)
+    def shared(cls) -> "UserDatabase":
+        """
+        Get the process-wide database instance
+        
+        The MongoClient is thread-safe and pools its own connections, so one
+        instance serves the whole process; it is closed when the process exits.
+        
+        Returns:
+            Shared UserDatabase instance
+        """
+        db = cls()
+        atexit.register(db.disconnect)
+        return db
+    
+    def __enter__(self) -> "UserDatabase":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        # Write out queued events but keep the client open for reuse
+        self.flush()
+        return False
+    
+    def _cache_get(self, key):
+        """Return a cached leaderboard/rank value, or None if missing or expired"""
+        entry = self._lb_cache.get(key)
+        if entry and time.monotonic() < entry[1]:
+            return entry[0]
+        return None
+    
+    def _cache_set(self, key, value, ttl: float = CACHE_TTL_SECONDS, generation: int = None):
+        """
+        Cache a leaderboard/rank value for ttl seconds
+        
+        A value computed before the last invalidation (older generation) is dropped.
+        """
+        if generation is not None and generation != self._cache_generation:
+            return
+        self._lb_cache[key] = (value, time.monotonic() + ttl)
+    
+    def _invalidate_cache(self):
+        """
+        Mark cached results out of date after a write changes standings
+        
+        Ranks are discarded. Leaderboards are kept but marked stale, so the next
+        read serves them while a background refresh runs instead of querying
+        inline after every win; a stale entry keeps its original expiry, so a
+        steady stream of wins can't keep it alive past the stale window.
+        """
+        self._cache_generation += 1
+        now = time.monotonic()
+        self._lb_cache = {
+            key: (value, min(expires_at, now))
+            for key, (value, expires_at) in list(self._lb_cache.items())
+            if key[0] == 'leaderboard'
+        }
+    
     # CREATE Operations
+    def _prepare_user(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate a new user document and add creation metadata"""
+        missing = _REQUIRED_USER_FIELDS - user_data.keys()
+        if missing:
+            raise ValueError(f"Missing required fields: {sorted(missing)}")
+        
+        user_data['created_at'] = _utcnow()
+        user_data['updated_at'] = _utcnow()
+        user_data['is_active'] = True
+        return user_data
+    
     def create_user(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Create a new user
@@ -81,20 +377,13 @@ class UserDatabase:
             Dictionary with created user info and success status
         """
         try:
-            # Validate required fields
-            required_fields = ['username', 'email', 'first_name', 'last_name']
-            for field in required_fields:
-                if field not in user_data:
-                    raise ValueError(f"Missing required field: {field}")
-            
-            # Add metadata
-            user_data['created_at'] = datetime.utcnow()
-            user_data['updated_at'] = datetime.utcnow()
-            user_data['is_active'] = True
+            # Validate required fields and add metadata
+            self._prepare_user(user_data)
             
             # Insert user
             result = self.users_collection.insert_one(user_data)
             
+            self._invalidate_cache()
             logger.info(f"✅ User created successfully: {user_data['username']}")
             return {
                 'success': True,
@@ -119,6 +408,74 @@ class UserDatabase:
                 'message': 'Failed to create user'
             }
     
+    def create_users(self, users_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Create several users with a single insert_many
+        
+        Args:
+            users_data: List of dictionaries containing user information
+            
+        Returns:
+            Dictionary with inserted IDs and per-user errors
+        """
+        errors = []
+        prepared = []
+        for user_data in users_data:
+            try:
+                prepared.append(self._prepare_user(user_data))
+            except ValueError as e:
+                errors.append({'username': user_data.get('username'), 'error': str(e)})
+        
+        if not prepared:
+            return {
+                'success': False,
+                'inserted_count': 0,
+                'user_ids': [],
+                'errors': errors,
+                'message': 'No valid users to create'
+            }
+        
+        try:
+            result = self.users_collection.insert_many(prepared, ordered=False)
+            user_ids = [str(inserted_id) for inserted_id in result.inserted_ids]
+        except BulkWriteError as e:
+            # Unordered inserts keep going past failed documents; report each one
+            failed = {error['index'] for error in e.details.get('writeErrors', [])}
+            for error in e.details.get('writeErrors', []):
+                user = prepared[error['index']]
+                if error.get('code') == 11000:
+                    logger.error(f"❌ Duplicate user error: {user.get('username')}")
+                    message = 'User with this email or username already exists'
+                else:
+                    message = error.get('errmsg', 'Unknown write error')
+                    logger.error(f"❌ Error creating user {user.get('username')}: {message}")
+                errors.append({
+                    'username': user.get('username'),
+                    'error': message
+                })
+            user_ids = [str(user['_id']) for i, user in enumerate(prepared) if i not in failed]
+        except Exception as e:
+            logger.error(f"❌ Error creating users: {e}")
+            return {
+                'success': False,
+                'inserted_count': 0,
+                'user_ids': [],
+                'errors': errors,
+                'error': str(e),
+                'message': 'Failed to create users'
+            }
+        
+        if user_ids:
+            self._invalidate_cache()
+        logger.info(f"✅ Created {len(user_ids)} of {len(users_data)} users")
+        return {
+            'success': not errors,
+            'inserted_count': len(user_ids),
+            'user_ids': user_ids,
+            'errors': errors,
+            'message': f'Created {len(user_ids)} users'
+        }
+    
     # READ Operations
     def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -131,11 +488,7 @@ class UserDatabase:
             User document or None if not found
         """
         try:
-            from bson import ObjectId
-            user = self.users_collection.find_one({"_id": ObjectId(user_id)})
-            if user:
-                user['_id'] = str(user['_id'])  # Convert ObjectId to string
-            return user
+            return self.users_collection.find_one({"_id": _oid(user_id)})
         except Exception as e:
             logger.error(f"❌ Error getting user by ID: {e}")
             return None
@@ -151,10 +504,7 @@ class UserDatabase:
             User document or None if not found
         """
         try:
-            user = self.users_collection.find_one({"email": email})
-            if user:
-                user['_id'] = str(user['_id'])
-            return user
+            return self.users_collection.find_one({"email": email})
         except Exception as e:
             logger.error(f"❌ Error getting user by email: {e}")
             return None
@@ -170,79 +520,92 @@ class UserDatabase:
             User document or None if not found
         """
         try:
-            user = self.users_collection.find_one({"username": username})
-            if user:
-                user['_id'] = str(user['_id'])
-            return user
+            return self.users_collection.find_one({"username": username})
         except Exception as e:
             logger.error(f"❌ Error getting user by username: {e}")
             return None
     
-    def get_all_users(self, limit: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+    def get_all_users(self, limit: int = 100, skip: int = 0,
+                      projection: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
         """
         Get all users with pagination
         
         Args:
             limit: Maximum number of users to return
             skip: Number of users to skip
+            projection: Optional fields to return (default: whole document)
             
         Returns:
-            List of user documents
+            Iterator over user documents, streamed from the cursor
         """
         try:
-            users = list(self.users_collection.find().skip(skip).limit(limit))
-            for user in users:
-                user['_id'] = str(user['_id'])
-            return users
+            cursor = self.users_collection.find({}, projection).skip(skip).limit(limit)
+            yield from cursor.batch_size(CURSOR_BATCH_SIZE)
         except Exception as e:
             logger.error(f"❌ Error getting all users: {e}")
-            return []
     
-    def search_users(self, query: Dict[str, Any], limit: int = 100) -> List[Dict[str, Any]]:
+    def search_users(self, query: Dict[str, Any], limit: int = 100,
+                     projection: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
         """
         Search users with custom query
         
         Args:
             query: MongoDB query dictionary
             limit: Maximum number of results
+            projection: Optional fields to return (default: whole document)
             
         Returns:
-            List of matching user documents
+            Iterator over matching user documents, streamed from the cursor
         """
         try:
-            users = list(self.users_collection.find(query).limit(limit))
-            for user in users:
-                user['_id'] = str(user['_id'])
-            return users
+            cursor = self.users_collection.find(query, projection).limit(limit)
+            yield from cursor.batch_size(CURSOR_BATCH_SIZE)
         except Exception as e:
             logger.error(f"❌ Error searching users: {e}")
-            return []
     
     # UPDATE Operations
-    def update_user(self, user_id: str, update_data: Dict[str, Any]) -> Dict[str, Any]:
+    def update_user(self, user_id: str, update_data: Dict[str, Any],
+                    return_doc: bool = False) -> Dict[str, Any]:
         """
         Update user information
         
         Args:
             user_id: User ID string
             update_data: Dictionary with fields to update
+            return_doc: Also return the updated user document (same round-trip)
             
         Returns:
             Dictionary with update result
         """
         try:
-            from bson import ObjectId
-            
-            # Add update timestamp
-            update_data['updated_at'] = datetime.utcnow()
-            
-            # Remove fields that shouldn't be updated
+            # Remove fields that shouldn't be updated; the server stamps updated_at
             update_data.pop('_id', None)
             update_data.pop('created_at', None)
+            update_data.pop('updated_at', None)
+            
+            if return_doc:
+                user = self.users_collection.find_one_and_update(
+                    {"_id": _oid(user_id)},
+                    _stamped_update(update_data),
+                    return_document=ReturnDocument.AFTER
+                )
+                if not user:
+                    return {
+                        'success': False,
+                        'message': 'User not found'
+                    }
+                
+                self._invalidate_cache()
+                logger.info(f"✅ User updated successfully: {user_id}")
+                return {
+                    'success': True,
+                    'user': user,
+                    'message': 'User updated successfully'
+                }
             
             result = self.users_collection.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": update_data}
+                {"_id": _oid(user_id)},
+                _stamped_update(update_data)
             )
             
             if result.matched_count == 0:
@@ -251,6 +614,7 @@ class UserDatabase:
                     'message': 'User not found'
                 }
             
+            self._invalidate_cache()
             logger.info(f"✅ User updated successfully: {user_id}")
             return {
                 'success': True,
@@ -278,13 +642,13 @@ class UserDatabase:
             Dictionary with update result
         """
         try:
-            update_data['updated_at'] = datetime.utcnow()
             update_data.pop('_id', None)
             update_data.pop('created_at', None)
+            update_data.pop('updated_at', None)
             
             result = self.users_collection.update_one(
                 {"email": email},
-                {"$set": update_data}
+                _stamped_update(update_data)
             )
             
             if result.matched_count == 0:
@@ -293,6 +657,7 @@ class UserDatabase:
                     'message': 'User not found'
                 }
             
+            self._invalidate_cache()
             logger.info(f"✅ User updated successfully: {email}")
             return {
                 'success': True,
@@ -320,9 +685,7 @@ class UserDatabase:
             Dictionary with delete result
         """
         try:
-            from bson import ObjectId
-            
-            result = self.users_collection.delete_one({"_id": ObjectId(user_id)})
+            result = self.users_collection.delete_one({"_id": _oid(user_id)})
             
             if result.deleted_count == 0:
                 return {
@@ -330,6 +693,7 @@ class UserDatabase:
                     'message': 'User not found'
                 }
             
+            self._invalidate_cache()
             logger.info(f"✅ User deleted successfully: {user_id}")
             return {
                 'success': True,
@@ -364,6 +728,7 @@ class UserDatabase:
                     'message': 'User not found'
                 }
             
+            self._invalidate_cache()
             logger.info(f"✅ User deleted successfully: {email}")
             return {
                 'success': True,
@@ -381,9 +746,9 @@ class UserDatabase:
     
     # Utility Methods
     def get_user_count(self) -> int:
-        """Get total number of users"""
+        """Get total number of users (from collection metadata, may be approximate)"""
         try:
-            return self.users_collection.count_documents({})
+            return self.users_collection.estimated_document_count()
         except Exception as e:
             logger.error(f"❌ Error getting user count: {e}")
             return 0
@@ -417,8 +782,7 @@ class UserDatabase:
             Number of wins
         """
         try:
-            from bson import ObjectId
-            user = self.users_collection.find_one({"_id": ObjectId(user_id)})
+            user = self.users_collection.find_one({"_id": _oid(user_id)}, {"wins": 1})
             if user:
                 return user.get('wins', 0)
             return 0
@@ -439,44 +803,39 @@ class UserDatabase:
             Dictionary with result
         """
         try:
-            from bson import ObjectId
-            
-            # Get current user data
-            user = self.users_collection.find_one({"_id": ObjectId(user_id)})
+            # Atomically bump wins and points, returning the updated counters
+            user = self.users_collection.find_one_and_update(
+                {"_id": _oid(user_id)},
+                {
+                    "$inc": {"wins": 1, "total_points": points},
+                    "$currentDate": {"updated_at": True}
+                },
+                projection={"wins": 1, "total_points": 1},
+                return_document=ReturnDocument.AFTER
+            )
             if not user:
                 return {
                     'success': False,
                     'message': 'User not found'
                 }
             
-            # Update wins count and total points
-            current_wins = user.get('wins', 0)
-            current_points = user.get('total_points', 0)
-            
-            update_data = {
-                'wins': current_wins + 1,
-                'total_points': current_points + points,
-                'updated_at': datetime.utcnow()
-            }
-            
-            result = self.users_collection.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": update_data}
-            )
+            new_wins = user.get('wins', 0)
+            new_points = user.get('total_points', 0)
+            self._invalidate_cache()
             
-            # Log the win
-            self.log_game_event(user_id, "win", {
+            # Queue the win log; it is written with the next batch
+            self._queue_game_event(user_id, "win", {
                 "game_type": game_type,
                 "points_earned": points,
-                "total_wins": current_wins + 1,
-                "total_points": current_points + points
+                "total_wins": new_wins,
+                "total_points": new_points
             })
             
             logger.info(f"✅ Win added for user {user_id}: {game_type}")
             return {
                 'success': True,
-                'new_wins_count': current_wins + 1,
-                'new_total_points': current_points + points,
+                'new_wins_count': new_wins,
+                'new_total_points': new_points,
                 'points_earned': points,
                 'message': 'Win recorded successfully'
             }
@@ -489,7 +848,8 @@ class UserDatabase:
                 'message': 'Failed to add win'
             }
     
-    def log_game_event(self, user_id: str, event_type: str, event_data: Dict[str, Any]) -> Dict[str, Any]:
+    def log_game_event(self, user_id: str, event_type: str,
+                       event_data: Union[Dict[str, Any], RiddleEvent, TreasureEvent]) -> Dict[str, Any]:
         """
         Log a game event
         
@@ -502,23 +862,24 @@ class UserDatabase:
             Dictionary with result
         """
         try:
-            from bson import ObjectId
-            
             event_log = {
-                "user_id": ObjectId(user_id),
+                "_id": ObjectId(),
+                "user_id": _oid(user_id),
                 "event_type": event_type,
                 "event_data": event_data,
-                "timestamp": datetime.utcnow(),
-                "created_at": datetime.utcnow()
+                "timestamp": _utcnow(),
+                "created_at": _utcnow()
             }
             
-            # Insert into game_logs collection
-            result = self.db.game_logs.insert_one(event_log)
+            # Insert into game_logs collection in the background
+            future = self._log_executor.submit(self.game_logs_collection.insert_one, event_log)
+            self._log_futures[future] = event_log["user_id"]
+            future.add_done_callback(self._log_write_done)
             
             logger.info(f"✅ Game event logged: {event_type} for user {user_id}")
             return {
                 'success': True,
-                'log_id': str(result.inserted_id),
+                'log_id': str(event_log['_id']),
                 'message': 'Event logged successfully'
             }
             
@@ -530,6 +891,75 @@ class UserDatabase:
                 'message': 'Failed to log event'
             }
     
+    def _log_write_done(self, future):
+        """Report a failed background game event insert"""
+        self._log_futures.pop(future, None)
+        error = future.exception()
+        if error:
+            logger.error(f"❌ Error writing game event: {error}")
+    
+    def _queue_game_event(self, user_id: str, event_type: str, event_data: Dict[str, Any]):
+        """Queue a game event and flush once a full batch has built up"""
+        now = _utcnow()
+        user_oid = _oid(user_id)
+        op = InsertOne({
+            "user_id": user_oid,
+            "event_type": event_type,
+            "event_data": event_data,
+            "timestamp": now,
+            "created_at": now
+        })
+        with self._pending_lock:
+            self._pending_ops.append((user_oid, op))
+            batch_full = len(self._pending_ops) >= LOG_BATCH_SIZE
+            if not batch_full and self._flush_timer is None:
+                self._flush_timer = threading.Timer(LOG_FLUSH_INTERVAL_SECONDS, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if batch_full:
+            self.flush()
+    
+    def flush(self, user_id: Optional[str] = None) -> int:
+        """
+        Wait for background event inserts, then write queued game events
+        in a single bulk_write
+        
+        Args:
+            user_id: Only flush this user's events, so a read of one profile
+                doesn't wait on everyone else's writes (default: all users)
+            
+        Returns:
+            Number of queued events written
+        """
+        user_oid = _oid(user_id) if user_id is not None else None
+        # copy() is atomic, unlike iterating while done-callbacks remove futures
+        futures = [future for future, oid in self._log_futures.copy().items()
+                   if user_oid is None or oid == user_oid]
+        if futures:
+            wait(futures)
+        
+        with self._pending_lock:
+            if self.game_logs_collection is None:
+                return 0
+            if user_oid is None:
+                queued, self._pending_ops = self._pending_ops, []
+            else:
+                queued = [entry for entry in self._pending_ops if entry[0] == user_oid]
+                self._pending_ops = [entry for entry in self._pending_ops if entry[0] != user_oid]
+            if not self._pending_ops and self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not queued:
+                return 0
+            ops = [op for _, op in queued]
+        
+        try:
+            result = self.game_logs_collection.bulk_write(ops, ordered=False)
+            return result.inserted_count
+        except Exception as e:
+            logger.error(f"❌ Error flushing game events: {e}")
+            return 0
+    
     def get_user_game_stats(self, user_id: str) -> Dict[str, Any]:
         """
         Get comprehensive game statistics for a user
@@ -541,31 +971,39 @@ class UserDatabase:
             Dictionary with game statistics
         """
         try:
-            from bson import ObjectId
-            
-            user = self.users_collection.find_one({"_id": ObjectId(user_id)})
+            user = self.users_collection.find_one(
+                {"_id": _oid(user_id)},
+                {"username": 1, "wins": 1, "total_points": 1}
+            )
             if not user:
                 return {
                     'success': False,
                     'message': 'User not found'
                 }
             
-            # Get game logs for this user
-            game_logs = list(self.db.game_logs.find({"user_id": ObjectId(user_id)}))
+            # Include any game events that are still queued
+            self.flush(user_id)
             
-            # Calculate statistics
+            # Calculate statistics from the one user fetch above; rank is
+            # derived from total_points rather than looking the user up again
             total_wins = user.get('wins', 0)
             total_points = user.get('total_points', 0)
-            total_events = len(game_logs)
             
-            # Count different event types
+            # Count different event types on the server
             event_counts = {}
-            for log in game_logs:
-                event_type = log.get('event_type', 'unknown')
-                event_counts[event_type] = event_counts.get(event_type, 0) + 1
+            for group in self.game_logs_collection.aggregate([
+                {"$match": {"user_id": _oid(user_id)}},
+                {"$group": {"_id": "$event_type", "count": {"$sum": 1}}}
+            ]):
+                event_type = group['_id'] or 'unknown'
+                event_counts[event_type] = event_counts.get(event_type, 0) + group['count']
+            total_events = sum(event_counts.values())
             
             # Get recent activity (last 10 events)
-            recent_events = sorted(game_logs, key=lambda x: x['timestamp'], reverse=True)[:10]
+            recent_events = list(self.game_logs_collection.find(
+                {"user_id": _oid(user_id)},
+                {"_id": 0, "event_type": 1, "timestamp": 1, "event_data": 1}
+            ).sort("timestamp", -1).limit(10))
             
             return {
                 'success': True,
@@ -582,7 +1020,7 @@ class UserDatabase:
                         'data': event.get('event_data', {})
                     } for event in recent_events
                 ],
-                'rank': self.get_user_rank(user_id)
+                'rank': self._rank_for_points(total_points)
             }
             
         except Exception as e:
@@ -604,25 +1042,33 @@ class UserDatabase:
             User's rank (1 = highest)
         """
         try:
-            from bson import ObjectId
-            
-            user = self.users_collection.find_one({"_id": ObjectId(user_id)})
+            user = self.users_collection.find_one({"_id": _oid(user_id)}, {"total_points": 1})
             if not user:
                 return 0
             
-            user_points = user.get('total_points', 0)
-            
-            # Count users with more points
-            higher_ranked = self.users_collection.count_documents({
-                "total_points": {"$gt": user_points}
-            })
-            
-            return higher_ranked + 1
+            return self._rank_for_points(user.get('total_points', 0))
             
         except Exception as e:
             logger.error(f"❌ Error getting user rank: {e}")
             return 0
     
+    def _rank_for_points(self, user_points: int) -> int:
+        """Rank for a points total: users with more points + 1 (ties share a rank)"""
+        # Users with the same points share a rank, so cache by points
+        cache_key = ('rank', user_points)
+        rank = self._cache_get(cache_key)
+        if rank is not None:
+            return rank
+        
+        # Count users with more points
+        higher_ranked = self.users_collection.count_documents({
+            "total_points": {"$gt": user_points}
+        })
+        
+        rank = higher_ranked + 1
+        self._cache_set(cache_key, rank)
+        return rank
+    
     def get_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
         """
         Get leaderboard of top players
@@ -634,28 +1080,131 @@ class UserDatabase:
             List of top players with their stats
         """
         try:
-            top_players = list(self.users_collection.find(
-                {"is_active": True}
-            ).sort("total_points", -1).limit(limit))
-            
-            leaderboard = []
-            for i, player in enumerate(top_players, 1):
-                leaderboard.append({
-                    'rank': i,
-                    'user_id': str(player['_id']),
-                    'username': player.get('username', 'Unknown'),
-                    'total_points': player.get('total_points', 0),
-                    'wins': player.get('wins', 0),
-                    'first_name': player.get('first_name', ''),
-                    'last_name': player.get('last_name', '')
-                })
-            
-            return leaderboard
+            # Callers get copies of the rows so they can't alter the cached ones
+            cache_key = ('leaderboard', limit)
+            entry = self._lb_cache.get(cache_key)
+            if entry:
+                leaderboard, expires_at = entry
+                now = time.monotonic()
+                if now < expires_at:
+                    return [dict(row) for row in leaderboard]
+                if now < expires_at + LEADERBOARD_STALE_SECONDS:
+                    # Serve the stale leaderboard and refresh it in the background
+                    self._refresh_leaderboard_async(limit)
+                    return [dict(row) for row in leaderboard]
+            
+            return [dict(row) for row in self._refresh_leaderboard(limit)]
             
         except Exception as e:
             logger.error(f"❌ Error getting leaderboard: {e}")
             return []
     
+    def _refresh_leaderboard(self, limit: int) -> List[Dict[str, Any]]:
+        """Query the top players and cache the result"""
+        generation = self._cache_generation
+        top_players = list(self.users_collection.find(
+            {"is_active": True},
+            _LEADERBOARD_PROJECTION
+        ).sort("total_points", -1).limit(limit))
+        
+        leaderboard = [_leaderboard_entry(i, player) for i, player in enumerate(top_players, 1)]
+        
+        self._cache_set(('leaderboard', limit), leaderboard,
+                        ttl=LEADERBOARD_TTL_SECONDS, generation=generation)
+        return leaderboard
+    
+    def _refresh_leaderboard_async(self, limit: int):
+        """Refresh a cached leaderboard on a daemon thread, once per limit"""
+        # Concurrent stale reads must not start duplicate refreshes
+        with self._lb_refreshing_lock:
+            if limit in self._lb_refreshing:
+                return
+            self._lb_refreshing.add(limit)
+        
+        def refresh():
+            try:
+                self._refresh_leaderboard(limit)
+            except Exception as e:
+                logger.error(f"❌ Error refreshing leaderboard: {e}")
+            finally:
+                with self._lb_refreshing_lock:
+                    self._lb_refreshing.discard(limit)
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def check_user_totals(self, limit: int = 100) -> Dict[str, Any]:
+        """
+        Compare users' wins and total_points with their logged win events
+        
+        wins/total_points are maintained by add_win's atomic $inc and are the
+        source of truth. Win logs are queued in memory and can be lost on a
+        crash or a failed flush, so the totals are only reported, never
+        rewritten from the logs; that would need the queued events to be
+        durable first.
+        
+        Args:
+            limit: Maximum number of drifted users to report
+            
+        Returns:
+            Dictionary with result and the users whose totals differ from their logs
+        """
+        try:
+            self.flush()
+            drift = [
+                {
+                    'user_id': str(row['_id']),
+                    'wins': row['wins'],
+                    'logged_wins': row['logged_wins'],
+                    'total_points': row['total_points'],
+                    'logged_points': row['logged_points']
+                }
+                for row in self.game_logs_collection.aggregate([
+                    {"$match": {"event_type": "win"}},
+                    {"$group": {
+                        "_id": "$user_id",
+                        "logged_wins": {"$sum": 1},
+                        "logged_points": {"$sum": "$event_data.points_earned"}
+                    }},
+                    {"$lookup": {
+                        "from": "users",
+                        "localField": "_id",
+                        "foreignField": "_id",
+                        "pipeline": [{"$project": {"wins": 1, "total_points": 1}}],
+                        "as": "user"
+                    }},
+                    {"$unwind": "$user"},
+                    {"$project": {
+                        "logged_wins": 1,
+                        "logged_points": 1,
+                        "wins": {"$ifNull": ["$user.wins", 0]},
+                        "total_points": {"$ifNull": ["$user.total_points", 0]}
+                    }},
+                    {"$match": {"$expr": {"$or": [
+                        {"$ne": ["$wins", "$logged_wins"]},
+                        {"$ne": ["$total_points", "$logged_points"]}
+                    ]}}},
+                    {"$limit": limit}
+                ])
+            ]
+            
+            if drift:
+                logger.warning(f"⚠️ {len(drift)} user(s) have totals that differ from their win logs")
+            else:
+                logger.info("✅ User totals match game logs")
+            return {
+                'success': True,
+                'drift': drift,
+                'message': f'Found {len(drift)} user(s) with drifted totals'
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Error checking user totals: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': 'Failed to check user totals'
+            }
+    
     def log_riddle_attempt(self, user_id: str, riddle_id: str, location: str, 
                           is_correct: bool, time_taken: float) -> Dict[str, Any]:
         """
@@ -672,19 +1221,13 @@ class UserDatabase:
             Dictionary with result
         """
         try:
-            event_data = {
-                "riddle_id": riddle_id,
-                "location": location,
-                "is_correct": is_correct,
-                "time_taken": time_taken,
-                "timestamp": datetime.utcnow()
-            }
+            event_data = RiddleEvent(riddle_id, location, is_correct, time_taken)
             
             result = self.log_game_event(user_id, "riddle_attempt", event_data)
             
             # If correct, add points and win
             if is_correct:
-                points = max(10, 50 - int(time_taken))  # More points for faster solving
+                points = _riddle_points(time_taken)
                 self.add_win(user_id, "riddle_solved", points)
             
             return result
@@ -712,12 +1255,7 @@ class UserDatabase:
             Dictionary with result
         """
         try:
-            event_data = {
-                "treasure_id": treasure_id,
-                "location": location,
-                "coordinates": coordinates,
-                "timestamp": datetime.utcnow()
-            }
+            event_data = TreasureEvent(treasure_id, location, coordinates)
             
             result = self.log_game_event(user_id, "treasure_found", event_data)
             
@@ -734,7 +1272,130 @@ class UserDatabase:
                 'message': 'Failed to log treasure found'
             }
     
-    def get_user_riddle_history(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+    def _log_game_events_bulk(self, event_type: str, events: List[tuple]) -> Dict[str, Any]:
+        """Insert (user_id, event_data) pairs as game events with one insert_many"""
+        if not events:
+            return {
+                'success': True,
+                'log_ids': [],
+                'message': 'No events to log'
+            }
+        
+        now = _utcnow()
+        result = self.game_logs_collection.insert_many([
+            {
+                "user_id": _oid(user_id),
+                "event_type": event_type,
+                "event_data": event_data,
+                "timestamp": now,
+                "created_at": now
+            } for user_id, event_data in events
+        ], ordered=False)
+        
+        logger.info(f"✅ Logged {len(result.inserted_ids)} {event_type} events")
+        return {
+            'success': True,
+            'log_ids': [str(log_id) for log_id in result.inserted_ids],
+            'message': 'Events logged successfully'
+        }
+    
+    def _add_wins_bulk(self, wins: List[tuple]) -> int:
+        """Apply (user_id, game_type, points) wins with one bulk_write and queue their win logs"""
+        if not wins:
+            return 0
+        
+        # One $inc per user, however many wins they have in the batch
+        totals = {}
+        for user_id, _, points in wins:
+            win_count, point_sum = totals.get(user_id, (0, 0))
+            totals[user_id] = (win_count + 1, point_sum + points)
+        
+        result = self.users_collection.bulk_write([
+            UpdateOne(
+                {"_id": _oid(user_id)},
+                {
+                    "$inc": {"wins": win_count, "total_points": point_sum},
+                    "$currentDate": {"updated_at": True}
+                }
+            ) for user_id, (win_count, point_sum) in totals.items()
+        ], ordered=False)
+        self._invalidate_cache()
+        
+        # Running totals aren't known without a read per user, so bulk win logs carry only the points
+        for user_id, game_type, points in wins:
+            self._queue_game_event(user_id, "win", {
+                "game_type": game_type,
+                "points_earned": points
+            })
+        
+        return result.modified_count
+    
+    def log_riddle_attempts_bulk(self, attempts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Log several riddle attempts with one insert and one points update
+        
+        Args:
+            attempts: Dictionaries with user_id, riddle_id, location,
+                is_correct and time_taken (same fields as log_riddle_attempt)
+            
+        Returns:
+            Dictionary with result
+        """
+        try:
+            result = self._log_game_events_bulk("riddle_attempt", [
+                (attempt['user_id'], RiddleEvent(attempt['riddle_id'], attempt['location'],
+                                                 attempt['is_correct'], attempt['time_taken']))
+                for attempt in attempts
+            ])
+            
+            # Correct answers still earn points and a win
+            self._add_wins_bulk([
+                (attempt['user_id'], "riddle_solved", _riddle_points(attempt['time_taken']))
+                for attempt in attempts if attempt['is_correct']
+            ])
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"❌ Error logging riddle attempts: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': 'Failed to log riddle attempts'
+            }
+    
+    def log_treasure_found_bulk(self, treasures: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Log several found treasures with one insert and one points update
+        
+        Args:
+            treasures: Dictionaries with user_id, treasure_id, location and
+                coordinates (same fields as log_treasure_found)
+            
+        Returns:
+            Dictionary with result
+        """
+        try:
+            result = self._log_game_events_bulk("treasure_found", [
+                (treasure['user_id'], TreasureEvent(treasure['treasure_id'], treasure['location'],
+                                                    treasure['coordinates']))
+                for treasure in treasures
+            ])
+            
+            # Add points for finding each treasure
+            self._add_wins_bulk([(treasure['user_id'], "treasure_found", 25) for treasure in treasures])
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"❌ Error logging treasures found: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': 'Failed to log treasures found'
+            }
+    
+    def get_user_riddle_history(self, user_id: str, limit: int = 20) -> Iterator[Dict[str, Any]]:
         """
         Get user's riddle solving history
         
@@ -743,31 +1404,22 @@ class UserDatabase:
             limit: Maximum number of records to return
             
         Returns:
-            List of riddle attempts
+            Iterator over riddle attempts, newest first
         """
         try:
-            from bson import ObjectId
-            
-            riddle_logs = list(self.db.game_logs.find({
-                "user_id": ObjectId(user_id),
+            self.flush(user_id)
+            riddle_logs = self.game_logs_collection.find({
+                "user_id": _oid(user_id),
                 "event_type": "riddle_attempt"
-            }).sort("timestamp", -1).limit(limit))
+            }, _RIDDLE_PROJECTION).sort("timestamp", -1).limit(limit).batch_size(CURSOR_BATCH_SIZE)
             
-            return [
-                {
-                    'riddle_id': log.get('event_data', {}).get('riddle_id'),
-                    'location': log.get('event_data', {}).get('location'),
-                    'is_correct': log.get('event_data', {}).get('is_correct'),
-                    'time_taken': log.get('event_data', {}).get('time_taken'),
-                    'timestamp': log.get('timestamp')
-                } for log in riddle_logs
-            ]
+            for log in riddle_logs:
+                yield _riddle_entry(log)
             
         except Exception as e:
             logger.error(f"❌ Error getting riddle history: {e}")
-            return []
     
-    def get_user_treasure_history(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+    def get_user_treasure_history(self, user_id: str, limit: int = 20) -> Iterator[Dict[str, Any]]:
         """
         Get user's treasure finding history
         
@@ -776,34 +1428,103 @@ class UserDatabase:
             limit: Maximum number of records to return
             
         Returns:
-            List of treasures found
+            Iterator over treasures found, newest first
         """
         try:
-            from bson import ObjectId
-            
-            treasure_logs = list(self.db.game_logs.find({
-                "user_id": ObjectId(user_id),
+            self.flush(user_id)
+            treasure_logs = self.game_logs_collection.find({
+                "user_id": _oid(user_id),
                 "event_type": "treasure_found"
-            }).sort("timestamp", -1).limit(limit))
+            }, _TREASURE_PROJECTION).sort("timestamp", -1).limit(limit).batch_size(CURSOR_BATCH_SIZE)
             
-            return [
-                {
-                    'treasure_id': log.get('event_data', {}).get('treasure_id'),
-                    'location': log.get('event_data', {}).get('location'),
-                    'coordinates': log.get('event_data', {}).get('coordinates'),
-                    'timestamp': log.get('timestamp')
-                } for log in treasure_logs
-            ]
+            for log in treasure_logs:
+                yield _treasure_entry(log)
             
         except Exception as e:
             logger.error(f"❌ Error getting treasure history: {e}")
-            return []
+    
+    def get_profile_bundle(self, user_id: str, history_limit: int = 20,
+                           leaderboard_limit: int = 5) -> Dict[str, Any]:
+        """
+        Get a user's stats, riddle/treasure history and the leaderboard in one query
+        
+        Args:
+            user_id: User ID string
+            history_limit: Maximum number of history records of each kind
+            leaderboard_limit: Number of top players to return
+            
+        Returns:
+            Dictionary with profile data
+        """
+        try:
+            self.flush(user_id)
+            
+            def history(event_type: str, projection: Dict[str, Any]) -> Dict[str, Any]:
+                return {"$lookup": {
+                    "from": "game_logs",
+                    "localField": "_id",
+                    "foreignField": "user_id",
+                    "pipeline": [
+                        {"$match": {"event_type": event_type}},
+                        {"$sort": {"timestamp": -1}},
+                        {"$limit": history_limit},
+                        {"$project": projection}
+                    ],
+                    "as": event_type
+                }}
+            
+            # Each $lookup runs against its own index, all in one round-trip
+            bundles = list(self.users_collection.aggregate([
+                {"$match": {"_id": _oid(user_id)}},
+                {"$project": {"username": 1, "wins": 1, "total_points": 1}},
+                history("riddle_attempt", _RIDDLE_PROJECTION),
+                history("treasure_found", _TREASURE_PROJECTION),
+                {"$lookup": {
+                    "from": "users",
+                    "pipeline": [
+                        {"$match": {"is_active": True}},
+                        {"$sort": {"total_points": -1}},
+                        {"$limit": leaderboard_limit},
+                        {"$project": _LEADERBOARD_PROJECTION}
+                    ],
+                    "as": "leaderboard"
+                }}
+            ]))
+            if not bundles:
+                return {
+                    'success': False,
+                    'message': 'User not found'
+                }
+            
+            bundle = bundles[0]
+            total_points = bundle.get('total_points', 0)
+            return {
+                'success': True,
+                'user_id': user_id,
+                'username': bundle.get('username', 'Unknown'),
+                'total_wins': bundle.get('wins', 0),
+                'total_points': total_points,
+                'rank': self._rank_for_points(total_points),
+                'riddle_history': [_riddle_entry(log) for log in bundle['riddle_attempt']],
+                'treasure_history': [_treasure_entry(log) for log in bundle['treasure_found']],
+                'leaderboard': [
+                    _leaderboard_entry(i, player) for i, player in enumerate(bundle['leaderboard'], 1)
+                ]
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Error getting profile bundle: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': 'Failed to get profile'
+            }
 
 
 def main():
     """Demo function to test the database operations"""
-    # Initialize database
-    db = UserDatabase()
+    # Use the shared database; its client is closed at exit
+    db = UserDatabase.shared()
     
     try:
         # Test data
@@ -832,13 +1553,12 @@ def main():
         
         # CREATE - Add test users
         print("\n📝 Creating users...")
-        for user in test_users:
-            result = db.create_user(user)
-            print(f"   {result}")
+        result = db.create_users(test_users)
+        print(f"   {result}")
         
         # READ - Get all users
         print("\n📖 Reading all users...")
-        users = db.get_all_users()
+        users = list(db.get_all_users())
         print(f"   Found {len(users)} users")
         
         # READ - Get user by email
@@ -850,14 +1570,14 @@ def main():
         # UPDATE - Update user
         print("\n✏️ Updating user...")
         if user:
-            update_result = db.update_user(user['_id'], {"age": 26, "location": "Boston, MA"})
-            print(f"   Update result: {update_result}")
-        
-        # READ - Get updated user
-        print("\n🔍 Getting updated user...")
-        updated_user = db.get_user_by_id(user['_id'])
-        if updated_user:
-            print(f"   Updated user: {updated_user['username']}, Age: {updated_user['age']}")
+            update_result = db.update_user(user['_id'], {"age": 26, "location": "Boston, MA"},
+                                           return_doc=True)
+            print(f"   Update result: {update_result['message']}")
+            
+            # The updated document comes back with the update itself
+            updated_user = update_result.get('user')
+            if updated_user:
+                print(f"   Updated user: {updated_user['username']}, Age: {updated_user['age']}")
         
         # DELETE - Delete user
         print("\n🗑️ Deleting user...")
@@ -896,11 +1616,15 @@ def main():
         # Test riddle logging
         print("\n🧩 Testing riddle logging...")
         if user:
-            db.log_riddle_attempt(user['_id'], "riddle_001", "Physical Science Building", True, 30.5)
-            db.log_riddle_attempt(user['_id'], "riddle_002", "Mann Library", False, 60.0)
+            db.log_riddle_attempts_bulk([
+                {"user_id": user['_id'], "riddle_id": "riddle_001", "location": "Physical Science Building",
+                 "is_correct": True, "time_taken": 30.5},
+                {"user_id": user['_id'], "riddle_id": "riddle_002", "location": "Mann Library",
+                 "is_correct": False, "time_taken": 60.0}
+            ])
             
             # Get riddle history
-            riddle_history = db.get_user_riddle_history(user['_id'])
+            riddle_history = list(db.get_user_riddle_history(user['_id']))
             print(f"   Riddle attempts: {len(riddle_history)}")
             for attempt in riddle_history[:3]:  # Show first 3
                 print(f"     - {attempt['location']}: {'✅' if attempt['is_correct'] else '❌'} ({attempt['time_taken']}s)")
@@ -908,17 +1632,27 @@ def main():
         # Test treasure logging
         print("\n🏴‍☠️ Testing treasure logging...")
         if user:
-            db.log_treasure_found(user['_id'], "treasure_001", "Physical Science Building", 
-                                {"latitude": 42.4483579, "longitude": -76.4800221})
-            db.log_treasure_found(user['_id'], "treasure_002", "Mann Library", 
-                                {"latitude": 42.4483176, "longitude": -76.4765426})
+            db.log_treasure_found_bulk([
+                {"user_id": user['_id'], "treasure_id": "treasure_001", "location": "Physical Science Building",
+                 "coordinates": {"latitude": 42.4483579, "longitude": -76.4800221}},
+                {"user_id": user['_id'], "treasure_id": "treasure_002", "location": "Mann Library",
+                 "coordinates": {"latitude": 42.4483176, "longitude": -76.4765426}}
+            ])
             
             # Get treasure history
-            treasure_history = db.get_user_treasure_history(user['_id'])
+            treasure_history = list(db.get_user_treasure_history(user['_id']))
             print(f"   Treasures found: {len(treasure_history)}")
             for treasure in treasure_history:
                 print(f"     - {treasure['location']} at {treasure['coordinates']}")
         
+        # Test profile bundle
+        print("\n👤 Testing profile bundle...")
+        if user:
+            profile = db.get_profile_bundle(user['_id'])
+            if profile['success']:
+                print(f"   {profile['username']}: {profile['total_points']} points, rank #{profile['rank']}")
+                print(f"   {len(profile['riddle_history'])} riddles, {len(profile['treasure_history'])} treasures")
+        
         # Test leaderboard
         print("\n🏅 Testing leaderboard...")
         leaderboard = db.get_leaderboard(5)
@@ -929,8 +1663,8 @@ def main():
     except Exception as e:
         print(f"❌ Demo failed: {e}")
     finally:
-        # Clean up
-        db.disconnect()
+        # Write out queued events; the client stays open until exit
+        db.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Precompress static AR assets for the HTTPS server
+Writes foo.js.br / foo.js.gz next to each asset so the server can send them as-is
+"""
+
+import gzip
+import os
+import sys
+
+from ar_server_common import COMPRESSIBLE_EXTENSIONS, COMPRESS_MIN_SIZE
+
+SKIP_DIRS = {'.git', '__pycache__', 'node_modules', '.venv', 'venv'}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def _is_fresh(source, target):
+    """True if target exists and is at least as new as source"""
+    try:
+        return os.path.getmtime(target) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+def _write(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def precompress(root='.'):
+    """Write .br/.gz variants for every asset under root; returns the number written"""
+    written = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for name in filenames:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(dirpath, name)
+            if os.path.getsize(path) < COMPRESS_MIN_SIZE:
+                continue
+
+            targets = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                targets.append(('.br', lambda data: brotli.compress(data, quality=11)))
+
+            data = None
+            for suffix, compress in targets:
+                if _is_fresh(path, path + suffix):
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = compress(data)
+                # Keep only variants that actually save bytes
+                if len(compressed) < len(data):
+                    _write(path + suffix, compressed)
+                    written += 1
+                    print(f"🗜️  {path}{suffix}: {len(data)} → {len(compressed)} bytes")
+    return written
+
+def main():
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    root = sys.argv[1] if len(sys.argv) > 1 else '.'
+
+    if brotli is None:
+        print("⚠️  brotli not installed, writing .gz only (pip install brotli)")
+
+    written = precompress(root)
+    print(f"✅ Precompressed {written} file(s)")
+
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,156 @@ Uses Gemini API to identify location and generate riddles
 """
 
 import os
+import re
 import json
+import time
+import tempfile
+import threading
 import requests
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    # Faster JSON parsing when available; its errors subclass json.JSONDecodeError
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+from typing import Dict, List, Optional, Tuple
+
+# On-disk cache of place lookups, shared across runs
+CACHE_FILE = ".riddle_cache.json"
+CACHE_TTL_SECONDS = 86400
+# Coordinates are rounded to this many decimals (~1 m) for cache keys
+COORD_PRECISION = 5
+# Generated riddles are fresh for RIDDLE_TTL_SECONDS, then served stale for up
+# to RIDDLE_STALE_SECONDS more while a background refresh runs
+RIDDLE_TTL_SECONDS = 3600
+RIDDLE_STALE_SECONDS = 300
+# Riddles generated concurrently by generate_location_riddles (<= session pool size)
+RIDDLE_WORKERS = 8
+# Gemini often wraps JSON replies in a ```json ... ``` fence
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*(?:```\s*)?$", re.S)
+# Place returned when Gemini can't identify the coordinates (Cornell campus)
+_FALLBACK_CORNELL = MappingProxyType({
+    "name": "Cornell University Physical Sciences Building",
+    "type": "University Building",
+    "institution": "Cornell University",
+    "city": "Ithaca",
+    "state": "New York",
+    "country": "United States",
+    "facts": (
+        "Built in 1961, it houses the Physics and Chemistry departments",
+        "Features state-of-the-art research laboratories",
+        "Named after the famous physicist who worked here"
+    ),
+    "description": "A prominent academic building at Cornell University"
+})
+
+
+def _fallback_place() -> Dict:
+    """Return a fresh copy of the fallback place, safe for callers to modify"""
+    return dict(_FALLBACK_CORNELL, facts=list(_FALLBACK_CORNELL["facts"]))
+
+
+def _copy_riddle(result: Dict) -> Dict:
+    """Return a copy of a cached riddle result, safe for callers to modify"""
+    return dict(result, place=dict(result["place"]))
+
 
 class LocationRiddleGenerator:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cache_file: str = CACHE_FILE):
         self.api_key = api_key
         self.base_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent"
+        self.cache_file = cache_file
+        
+        # One keep-alive session so Gemini/geocoding calls reuse TLS connections
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            # Gemini answers transient overloads with 429/503, so POST is retried on
+            # those statuses. A read timeout is not retried: the hung request may
+            # still be generating (and billed), and the caller has a fallback.
+            max_retries=Retry(
+                total=5,
+                connect=1,
+                read=0,
+                status=3,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=["GET", "POST"]
+            )
+        ))
+        self._session.headers["Content-Type"] = "application/json"
+        self._cache = self._load_cache()
+        # Held while updating the lookup cache and writing it to disk
+        self._cache_lock = threading.Lock()
+        self._riddle_cache = {}
+        self._riddle_lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=2)
+    
+    def close(self):
+        """Stop background riddle refreshes and close the HTTP session"""
+        self._refresh_executor.shutdown(wait=False)
+        self._session.close()
+    
+    def __enter__(self) -> "LocationRiddleGenerator":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.close()
+        return False
+    
+    def _load_cache(self) -> Dict:
+        """Load cached lookups from disk, dropping expired entries"""
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {k: v for k, v in cache.items() if v.get("expires", 0) > now}
+    
+    def _cache_key(self, kind: str, latitude: float, longitude: float) -> str:
+        """Cache key for a lookup at coordinates rounded to COORD_PRECISION"""
+        return f"{kind}:{round(latitude, COORD_PRECISION)},{round(longitude, COORD_PRECISION)}"
+    
+    def _cache_get(self, key: str) -> Optional[object]:
+        """Return a cached value, or None if missing or expired"""
+        entry = self._cache.get(key)
+        if entry and entry["expires"] > time.time():
+            return entry["value"]
+        return None
+    
+    def _cache_set(self, key: str, value: object):
+        """Cache a value in memory and persist the cache to disk"""
+        with self._cache_lock:
+            self._cache[key] = {"value": value, "expires": time.time() + CACHE_TTL_SECONDS}
+            snapshot = dict(self._cache)
+            # Saves are serialized so an older snapshot never replaces a newer one
+            tmp_file = None
+            try:
+                fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.cache_file)), suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp_file, self.cache_file)
+            except OSError as e:
+                print(f"⚠️ Could not save cache: {e}")
+                if tmp_file and os.path.exists(tmp_file):
+                    os.remove(tmp_file)
     
     def identify_place(self, latitude: float, longitude: float) -> Dict:
         """Identify place from coordinates"""
+        cache_key = self._cache_key("place", latitude, longitude)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            print(f"⚡ Using cached place for {latitude}, {longitude}")
+            # A copy, so callers can't alter the cached entry (or the next dump to disk)
+            return dict(cached)
+        
         # First, get general location info using reverse geocoding
         try:
             location_info = self._get_location_info(latitude, longitude)
@@ -49,50 +188,22 @@ Return ONLY valid JSON in this exact format:
         response = self._call_gemini(prompt)
         
         # Clean the response to extract JSON
-        response = response.strip()
-        if response.startswith('```json'):
-            response = response[7:]
-        if response.endswith('```'):
-            response = response[:-3]
-        if response.startswith('```'):
-            response = response[3:]
+        match = _FENCE_RE.match(response)
+        if match:
+            response = match.group(1)
         
         try:
-            return json.loads(response)
+            place_info = _json_loads(response)
+            self._cache_set(cache_key, place_info)
+            return dict(place_info)
         except json.JSONDecodeError as e:
             print(f"⚠️ JSON parsing failed, using fallback data")
             # Fallback data for Cornell coordinates (42.449268, -76.4837724)
-            return {
-                "name": "Cornell University Physical Sciences Building",
-                "type": "University Building",
-                "institution": "Cornell University",
-                "city": "Ithaca",
-                "state": "New York",
-                "country": "United States",
-                "facts": [
-                    "Built in 1961, it houses the Physics and Chemistry departments",
-                    "Features state-of-the-art research laboratories",
-                    "Named after the famous physicist who worked here"
-                ],
-                "description": "A prominent academic building at Cornell University"
-            }
+            return _fallback_place()
         except Exception as e:
             print(f"⚠️ API call failed: {e}, using fallback data")
             # Fallback data for Cornell coordinates
-            return {
-                "name": "Cornell University Physical Sciences Building",
-                "type": "University Building",
-                "institution": "Cornell University",
-                "city": "Ithaca",
-                "state": "New York",
-                "country": "United States",
-                "facts": [
-                    "Built in 1961, it houses the Physics and Chemistry departments",
-                    "Features state-of-the-art research laboratories",
-                    "Named after the famous physicist who worked here"
-                ],
-                "description": "A prominent academic building at Cornell University"
-            }
+            return _fallback_place()
     
     def generate_riddle(self, place_info: Dict) -> str:
         """Generate riddle based on place information"""
@@ -113,7 +224,60 @@ Return ONLY valid JSON in this exact format:
         return self._call_gemini(prompt).strip()
     
     def generate_location_riddle(self, latitude: float, longitude: float) -> Dict:
-        """Generate complete riddle for given coordinates"""
+        """Generate complete riddle for given coordinates (stale-while-revalidate)"""
+        cache_key = self._cache_key("riddle", latitude, longitude)
+        with self._riddle_lock:
+            entry = self._riddle_cache.get(cache_key)
+        
+        if entry:
+            result, fresh_until = entry
+            now = time.time()
+            if now < fresh_until:
+                return _copy_riddle(result)
+            if now < fresh_until + RIDDLE_STALE_SECONDS:
+                # Serve the stale riddle now and regenerate it in the background
+                self._schedule_refresh(cache_key, latitude, longitude)
+                return _copy_riddle(result)
+        
+        return _copy_riddle(self._refresh_riddle(cache_key, latitude, longitude))
+    
+    def generate_location_riddles(self, coordinates: List[Tuple[float, float]]) -> List[Dict]:
+        """Generate riddles for several coordinates, overlapping their API calls"""
+        if not coordinates:
+            return []
+        
+        # Each riddle is a chain of dependent calls, but separate coordinates
+        # are independent, so total latency is the slowest chain, not the sum
+        with ThreadPoolExecutor(max_workers=min(len(coordinates), RIDDLE_WORKERS)) as executor:
+            return list(executor.map(lambda coords: self.generate_location_riddle(*coords), coordinates))
+    
+    def _schedule_refresh(self, cache_key: str, latitude: float, longitude: float):
+        """Regenerate a cached riddle in the background, once per key"""
+        with self._riddle_lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+        
+        def refresh():
+            try:
+                self._refresh_riddle(cache_key, latitude, longitude)
+            except Exception as e:
+                print(f"⚠️ Background riddle refresh failed: {e}")
+            finally:
+                with self._riddle_lock:
+                    self._refreshing.discard(cache_key)
+        
+        self._refresh_executor.submit(refresh)
+    
+    def _refresh_riddle(self, cache_key: str, latitude: float, longitude: float) -> Dict:
+        """Generate a riddle and store it in the riddle cache"""
+        result = self._build_location_riddle(latitude, longitude)
+        with self._riddle_lock:
+            self._riddle_cache[cache_key] = (result, time.time() + RIDDLE_TTL_SECONDS)
+        return result
+    
+    def _build_location_riddle(self, latitude: float, longitude: float) -> Dict:
+        """Identify the place at the coordinates and generate its riddle"""
         print(f"🔍 Identifying place at {latitude}, {longitude}...")
         
         # Identify the place
@@ -161,48 +325,31 @@ Return ONLY valid JSON in this exact format:
     
     def _get_place_facts(self, place_name: str) -> List[str]:
         """Get specific facts for known places"""
-        facts_map = {
-            "Physical Science Building": [
-                "Built in 1961, it houses the Physics and Chemistry departments",
-                "Features state-of-the-art research laboratories", 
-                "Named after the famous physicist who worked here"
-            ],
-            "Albert R. Mann Library": [
-                "Named after Cornell's first president",
-                "Houses extensive collections of agricultural and life sciences materials",
-                "Features modern study spaces and research facilities"
-            ],
-            "Animal Health Diagnostic Center": [
-                "Provides veterinary diagnostic services",
-                "Supports animal health research and education",
-                "Features advanced laboratory facilities"
-            ],
-            "Herbert F. Johnson Museum of Art": [
-                "Designed by I.M. Pei, features a distinctive concrete and glass design",
-                "Houses over 35,000 works of art from around the world",
-                "Offers stunning views of Cayuga Lake from its upper floors"
-            ],
-            "Baker Flagpole": [
-                "A prominent landmark in the center of campus",
-                "Surrounded by the Arts Quad, one of Cornell's most iconic spaces",
-                "Often used as a meeting point for students and visitors"
-            ]
-        }
-        return facts_map.get(place_name, [
+        facts = _FACTS_MAP.get(place_name)
+        if facts:
+            return list(facts)
+        return [
             f"An important location at Cornell University",
             f"Part of the historic Cornell campus",
             f"A significant {place_name.lower()}"
-        ])
+        ]
     
     def _get_location_info(self, latitude: float, longitude: float) -> str:
         """Get general location info using reverse geocoding"""
+        cache_key = self._cache_key("location", latitude, longitude)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             # Use a free reverse geocoding service
             url = f"https://api.bigdatacloud.net/data/reverse-geocode-client?latitude={latitude}&longitude={longitude}&localityLanguage=en"
-            response = requests.get(url, timeout=10)
+            response = self._session.get(url, timeout=10)
             if response.status_code == 200:
                 data = response.json()
-                return f"{data.get('locality', 'Unknown')}, {data.get('principalSubdivision', 'Unknown')}, {data.get('countryName', 'Unknown')}"
+                location_info = f"{data.get('locality', 'Unknown')}, {data.get('principalSubdivision', 'Unknown')}, {data.get('countryName', 'Unknown')}"
+                self._cache_set(cache_key, location_info)
+                return location_info
             else:
                 return "Unknown location"
         except:
@@ -210,7 +357,6 @@ Return ONLY valid JSON in this exact format:
     
     def _call_gemini(self, prompt: str) -> str:
         """Make API call to Gemini"""
-        headers = {"Content-Type": "application/json"}
         data = {
             "contents": [{"parts": [{"text": prompt}]}],
             "generationConfig": {
@@ -222,11 +368,10 @@ Return ONLY valid JSON in this exact format:
         }
         
         try:
-            response = requests.post(
+            response = self._session.post(
                 f"{self.base_url}?key={self.api_key}",
-                headers=headers,
                 json=data,
-                timeout=30
+                timeout=(3.05, 30)  # (connect, read)
             )
             
             if response.status_code != 200:
@@ -255,6 +400,56 @@ Return ONLY valid JSON in this exact format:
             raise Exception(f"API call failed: {e}")
 
 
+# Known campus places, as (latitude, longitude) -> name
+PLACES = {
+    (42.4483579, -76.4800221): "Physical Science Building",
+    (42.4483176, -76.4765426): "Albert R. Mann Library",
+    (42.4485359, -76.4667365): "Animal Health Diagnostic Center",
+    (42.4498775, -76.4881075): "Herbert F. Johnson Museum of Art",
+    (42.4495615, -76.4865407): "Baker Flagpole"
+}
+_PLACE_ITEMS = tuple(PLACES.items())
+
+# Facts about the known places, used by _get_place_facts
+_FACTS_MAP = MappingProxyType({
+    "Physical Science Building": (
+        "Built in 1961, it houses the Physics and Chemistry departments",
+        "Features state-of-the-art research laboratories",
+        "Named after the famous physicist who worked here"
+    ),
+    "Albert R. Mann Library": (
+        "Named after Cornell's first president",
+        "Houses extensive collections of agricultural and life sciences materials",
+        "Features modern study spaces and research facilities"
+    ),
+    "Animal Health Diagnostic Center": (
+        "Provides veterinary diagnostic services",
+        "Supports animal health research and education",
+        "Features advanced laboratory facilities"
+    ),
+    "Herbert F. Johnson Museum of Art": (
+        "Designed by I.M. Pei, features a distinctive concrete and glass design",
+        "Houses over 35,000 works of art from around the world",
+        "Offers stunning views of Cayuga Lake from its upper floors"
+    ),
+    "Baker Flagpole": (
+        "A prominent landmark in the center of campus",
+        "Surrounded by the Arts Quad, one of Cornell's most iconic spaces",
+        "Often used as a meeting point for students and visitors"
+    )
+})
+
+
+def find_closest_place(target_lat: float, target_lng: float) -> str:
+    """Return the name of the known place closest to the given coordinates"""
+    # Squared distance ranks the same as distance, so skip the square root
+    (_, name) = min(
+        _PLACE_ITEMS,
+        key=lambda item: (target_lat - item[0][0]) ** 2 + (target_lng - item[0][1]) ** 2
+    )
+    return name
+
+
 def main():
     """Main function to generate riddle for given coordinates"""
     # Get API key from environment or prompt user
@@ -265,39 +460,17 @@ def main():
             print("❌ No API key provided. Exiting.")
             return
 
-    places = {
-        (42.4483579, -76.4800221): "Physical Science Building",
-        (42.4483176, -76.4765426): "Albert R. Mann Library", 
-        (42.4485359, -76.4667365): "Animal Health Diagnostic Center",
-        (42.4498775, -76.4881075): "Herbert F. Johnson Museum of Art",
-        (42.4495615, -76.4865407): "Baker Flagpole"
-    }
-
-    # Find the closest match to the input coordinates
-    def find_closest_place(target_lat, target_lng, places_dict):
-        min_distance = float('inf')
-        closest_place = None
-        
-        for (lat, lng), place_name in places_dict.items():
-            # Simple distance calculation
-            distance = ((target_lat - lat) ** 2 + (target_lng - lng) ** 2) ** 0.5
-            if distance < min_distance:
-                min_distance = distance
-                closest_place = place_name
-        
-        return closest_place
-
     # Get coordinates from user or use default
     # latitude = float(input("Enter latitude (or press Enter for 42.4483579): ") or "42.4483579")
     # longitude = float(input("Enter longitude (or press Enter for -76.4800221): ") or "-76.4800221")
 
     # Find the mapped location name
-    location_name = find_closest_place(latitude, longitude, places)
+    location_name = find_closest_place(latitude, longitude)
     print(f"📍 Mapped location: {location_name}")
 
     try:
-        generator = LocationRiddleGenerator(api_key)
-        result = generator.generate_riddle_for_known_place(location_name, latitude, longitude)   
+        with LocationRiddleGenerator(api_key) as generator:
+            result = generator.generate_riddle_for_known_place(location_name, latitude, longitude)
         print("\n" + "="*50)
         print("🎯 LOCATION RIDDLE GENERATED")
         print("="*50)
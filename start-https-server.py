@@ -4,37 +4,53 @@ HTTPS server for AR Game with device sensor access
 Run this script to start a local HTTPS server for the WebAR app
 """
 
-import http.server
-import socketserver
-import webbrowser
 import os
 import sys
 import subprocess
-import signal
-import time
-import ssl
-import tempfile
-import atexit
+import errno
+import ipaddress
+from pathlib import Path
 
-PORT = 8443
+from ar_server_common import create_ssl_context, run_server, serve_asgi
 
-class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        # Add CORS headers for AR.js
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        super().end_headers()
+PORT = 8443
+# Directory served (the one containing this script)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BANNER = [
+    f"✅ HTTPS Server started successfully!",
+    f"📱 Server running at: https://localhost:{PORT}",
+    f"🎯 Open your browser and go to: https://localhost:{PORT}",
+    f"📱 Mobile access: https://10.50.7.23:{PORT}",
+    f"🔒 HTTPS enabled for device sensor access!",
+    f"⚠️  Browser will show security warning - click 'Advanced' and 'Proceed'",
+    f"⏹️  Press Ctrl+C to stop the server",
+    "-" * 50
+]
+
+# Self-signed certificate is cached here and reused across runs
+CERT_DIR = Path.home() / '.ar_treasure'
+CERT_FILE = CERT_DIR / 'cert.pem'
+KEY_FILE = CERT_DIR / 'key.pem'
+# Regenerate the cached certificate when it has less than this left
+CERT_MIN_VALIDITY = 7  # days
+
+def _write_atomic(path, data, mode=0o644):
+    """Write bytes to path via a temp file and os.replace"""
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
 
 def create_self_signed_cert():
-    """Create a self-signed certificate for HTTPS"""
+    """Create a self-signed certificate for HTTPS, reusing the cached one if still valid"""
     try:
         import cryptography
         from cryptography import x509
         from cryptography.x509.oid import NameOID
         from cryptography.hazmat.primitives import hashes, serialization
-        from cryptography.hazmat.primitives.asymmetric import rsa
-        from datetime import datetime, timedelta
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from datetime import datetime, timedelta, timezone
     except ImportError:
         print("❌ cryptography library not found. Installing...")
         subprocess.run([sys.executable, '-m', 'pip', 'install', 'cryptography'], check=True)
@@ -42,14 +58,23 @@ def create_self_signed_cert():
         from cryptography import x509
         from cryptography.x509.oid import NameOID
         from cryptography.hazmat.primitives import hashes, serialization
-        from cryptography.hazmat.primitives.asymmetric import rsa
-        from datetime import datetime, timedelta
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from datetime import datetime, timedelta, timezone
+
+    # Reuse the cached certificate unless it is missing or about to expire
+    if CERT_FILE.exists() and KEY_FILE.exists():
+        try:
+            cached = x509.load_pem_x509_certificate(CERT_FILE.read_bytes())
+            # not_valid_after_utc is cryptography 42+; older releases only have the naive UTC value
+            not_after = getattr(cached, 'not_valid_after_utc', None) or cached.not_valid_after.replace(tzinfo=timezone.utc)
+            if not_after > datetime.now(timezone.utc) + timedelta(days=CERT_MIN_VALIDITY):
+                print("✅ Using cached certificate")
+                return str(CERT_FILE), str(KEY_FILE)
+        except ValueError:
+            pass
 
-    # Generate private key
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-    )
+    # Generate private key (ECDSA P-256: fast keygen, accepted by all browsers)
+    private_key = ec.generate_private_key(ec.SECP256R1())
 
     # Create certificate
     subject = issuer = x509.Name([
@@ -69,133 +94,51 @@ def create_self_signed_cert():
     ).serial_number(
         x509.random_serial_number()
     ).not_valid_before(
-        datetime.utcnow()
+        datetime.now(timezone.utc)
     ).not_valid_after(
-        datetime.utcnow() + timedelta(days=365)
+        datetime.now(timezone.utc) + timedelta(days=365)
     ).add_extension(
         x509.SubjectAlternativeName([
             x509.DNSName("localhost"),
-            x509.IPAddress("127.0.0.1"),
+            x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
         ]),
         critical=False,
     ).sign(private_key, hashes.SHA256())
 
-    # Write certificate and key to temporary files
-    cert_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.pem')
-    key_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.pem')
-
-    cert_file.write(cert.public_bytes(serialization.Encoding.PEM))
-    key_file.write(private_key.private_bytes(
+    # Write certificate and key to the cache directory
+    CERT_DIR.mkdir(parents=True, exist_ok=True)
+    _write_atomic(KEY_FILE, private_key.private_bytes(
         encoding=serialization.Encoding.PEM,
         format=serialization.PrivateFormat.PKCS8,
         encryption_algorithm=serialization.NoEncryption()
-    ))
-
-    cert_file.close()
-    key_file.close()
-
-    # Register cleanup function
-    def cleanup():
-        try:
-            os.unlink(cert_file.name)
-            os.unlink(key_file.name)
-        except:
-            pass
-
-    atexit.register(cleanup)
+    ), mode=0o600)
+    _write_atomic(CERT_FILE, cert.public_bytes(serialization.Encoding.PEM))
+    print("✅ Certificate created successfully")
 
-    return cert_file.name, key_file.name
-
-def kill_port_processes(port):
-    """Kill any processes using the specified port"""
-    try:
-        # Find processes using the port
-        result = subprocess.run(['lsof', '-ti', f':{port}'], 
-                              capture_output=True, text=True)
-        
-        if result.returncode == 0 and result.stdout.strip():
-            pids = result.stdout.strip().split('\n')
-            print(f"🔍 Found {len(pids)} process(es) using port {port}")
-            
-            for pid in pids:
-                if pid.strip():
-                    try:
-                        print(f"🔄 Killing process {pid}...")
-                        os.kill(int(pid), signal.SIGTERM)
-                        time.sleep(1)  # Give it time to die
-                        
-                        # Check if it's still running and force kill if needed
-                        try:
-                            os.kill(int(pid), 0)  # Check if process exists
-                            print(f"⚡ Force killing process {pid}...")
-                            os.kill(int(pid), signal.SIGKILL)
-                        except ProcessLookupError:
-                            print(f"✅ Process {pid} terminated successfully")
-                            
-                    except (ValueError, ProcessLookupError, PermissionError) as e:
-                        print(f"⚠️  Could not kill process {pid}: {e}")
-            
-            print(f"✅ Cleaned up port {port}")
-            time.sleep(2)  # Wait a bit more for cleanup
-        else:
-            print(f"✅ Port {port} is free")
-            
-    except FileNotFoundError:
-        print("⚠️  lsof command not found, trying alternative method...")
-        # Alternative method for systems without lsof
-        try:
-            result = subprocess.run(['netstat', '-tulpn'], capture_output=True, text=True)
-            if f':{port}' in result.stdout:
-                print(f"⚠️  Port {port} appears to be in use, but cannot kill processes automatically")
-                print("💡 Please manually stop any server running on this port")
-        except FileNotFoundError:
-            print("⚠️  Cannot check port status automatically")
+    return str(CERT_FILE), str(KEY_FILE)
 
 def main():
     # Change to the directory containing this script
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(SCRIPT_DIR)
     
     print(f"🚀 AR Game HTTPS Server starting...")
-    print(f"🔍 Checking port {PORT}...")
-    
-    # Kill any existing processes on port 8443
-    kill_port_processes(PORT)
     
     try:
-        # Create self-signed certificate
-        print("🔐 Creating self-signed certificate...")
+        # Create (or reuse) self-signed certificate
+        print("🔐 Preparing self-signed certificate...")
         cert_file, key_file = create_self_signed_cert()
-        print("✅ Certificate created successfully")
         
-        with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
-            # Wrap socket with SSL
-            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-            context.load_cert_chain(cert_file, key_file)
-            httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
-            
-            print(f"✅ HTTPS Server started successfully!")
-            print(f"📱 Server running at: https://localhost:{PORT}")
-            print(f"🎯 Open your browser and go to: https://localhost:{PORT}")
-            print(f"📱 Mobile access: https://10.50.7.23:{PORT}")
-            print(f"🔒 HTTPS enabled for device sensor access!")
-            print(f"⚠️  Browser will show security warning - click 'Advanced' and 'Proceed'")
-            print(f"⏹️  Press Ctrl+C to stop the server")
-            print("-" * 50)
-            
-            # Try to open browser automatically
-            try:
-                webbrowser.open(f'https://localhost:{PORT}')
-                print("🌐 Browser opened automatically")
-            except:
-                print("⚠️  Could not open browser automatically")
-            
-            httpd.serve_forever()
-            
+        # Prefer the ASGI server for many concurrent connections; the http.server
+        # fallback is the tuned path (in-memory cache, sendfile, TLS session tickets)
+        if serve_asgi(PORT, BANNER, cert_file, key_file):
+            return
+        
+        run_server(PORT, create_ssl_context(cert_file, key_file), banner=BANNER)
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")
         sys.exit(0)
     except OSError as e:
-        if e.errno == 48:  # Address already in use
+        if e.errno == errno.EADDRINUSE:  # Address already in use
             print(f"❌ Port {PORT} is still in use after cleanup attempt.")
             print("💡 Try running: python3 -m http.server 8444")
             print("💡 Or manually kill processes: sudo lsof -ti :8443 | xargs kill -9")
@@ -3,38 +3,29 @@
 Simple HTTPS server using built-in SSL
 """
 
-import http.server
-import socketserver
 import ssl
 import os
 import sys
 
-PORT = 8443
+from ar_server_common import ARHTTPServer, MyHTTPRequestHandler
 
-class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        # Add CORS headers for AR.js
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        super().end_headers()
+PORT = 8443
+# Directory served (the one containing this script)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 def main():
     # Change to the directory containing this script
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(SCRIPT_DIR)
     
     print(f"🚀 Starting HTTPS server on port {PORT}...")
     
     try:
-        with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
+        with ARHTTPServer(("", PORT), MyHTTPRequestHandler) as httpd:
             # Create SSL context
-            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            httpd.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
             
             # Create self-signed certificate
-            context.load_cert_chain('server.pem', 'server.key')
-            
-            # Wrap socket with SSL
-            httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+            httpd.ssl_context.load_cert_chain('server.pem', 'server.key')
             
             print(f"✅ HTTPS Server started!")
             print(f"📱 Access at: https://localhost:{PORT}")
@@ -4,108 +4,144 @@ HTTPS server for AR Game with device sensor access
 Run this script to start a local HTTPS server for the WebAR app
 """
 
-import http.server
-import socketserver
-import webbrowser
+import errno
 import os
-import sys
 import subprocess
-import signal
-import time
-import ssl
+import sys
+from datetime import datetime, timedelta, timezone
+
+from ar_server_common import create_ssl_context, run_server, serve_asgi
 
 PORT = 8443
+# Directory served (the one containing this script)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Regenerate the certificate when it has less than this left
+CERT_MIN_VALIDITY = timedelta(days=7)
 
-class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        # Add CORS headers for AR.js
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        super().end_headers()
+# (cert_file, key_file, not_after) of the certificate already checked by this process
+_cert_cache = None
 
-def kill_port_processes(port):
-    """Kill any processes using the specified port"""
+def _cert_not_after(cert_file):
+    """Return the certificate's expiry, or datetime.max if it can't be checked"""
     try:
-        # Find processes using the port
-        result = subprocess.run(['lsof', '-ti', f':{port}'], 
-                              capture_output=True, text=True)
-        
-        if result.returncode == 0 and result.stdout.strip():
-            pids = result.stdout.strip().split('\n')
-            print(f"🔍 Found {len(pids)} process(es) using port {port}")
-            
-            for pid in pids:
-                if pid.strip():
-                    try:
-                        print(f"🔄 Killing process {pid}...")
-                        os.kill(int(pid), signal.SIGTERM)
-                        time.sleep(1)  # Give it time to die
-                        
-                        # Check if it's still running and force kill if needed
-                        try:
-                            os.kill(int(pid), 0)  # Check if process exists
-                            print(f"⚡ Force killing process {pid}...")
-                            os.kill(int(pid), signal.SIGKILL)
-                        except ProcessLookupError:
-                            print(f"✅ Process {pid} terminated successfully")
-                            
-                    except (ValueError, ProcessLookupError, PermissionError) as e:
-                        print(f"⚠️  Could not kill process {pid}: {e}")
-            
-            print(f"✅ Cleaned up port {port}")
-            time.sleep(2)  # Wait a bit more for cleanup
-        else:
-            print(f"✅ Port {port} is free")
-            
+        from cryptography import x509
+    except ImportError:
+        # Without cryptography, trust an existing certificate as before
+        return datetime.max.replace(tzinfo=timezone.utc)
+    try:
+        with open(cert_file, 'rb') as f:
+            cert = x509.load_pem_x509_certificate(f.read())
+        # not_valid_after_utc is cryptography 42+; older releases only have the naive UTC value
+        return getattr(cert, 'not_valid_after_utc', None) or cert.not_valid_after.replace(tzinfo=timezone.utc)
+    except (OSError, ValueError):
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+def _create_ssl_cert_openssl(cert_file, key_file):
+    """Create the certificate with the openssl CLI; returns False if that fails"""
+    try:
+        subprocess.run([
+            'openssl', 'req', '-new', '-x509', '-keyout', key_file,
+            '-out', cert_file, '-days', '365', '-nodes',
+            '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1',
+            '-subj', '/C=US/ST=CA/L=SF/O=AR/CN=localhost'
+        ], check=True, capture_output=True)
+        os.chmod(key_file, 0o600)
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Failed to create SSL certificate: {e}")
+        print("💡 Please install OpenSSL: brew install openssl")
+        return False
     except FileNotFoundError:
-        print("⚠️  lsof command not found, trying alternative method...")
-        # Alternative method for systems without lsof
-        try:
-            result = subprocess.run(['netstat', '-tulpn'], capture_output=True, text=True)
-            if f':{port}' in result.stdout:
-                print(f"⚠️  Port {port} appears to be in use, but cannot kill processes automatically")
-                print("💡 Please manually stop any server running on this port")
-        except FileNotFoundError:
-            print("⚠️  Cannot check port status automatically")
+        print("❌ OpenSSL not found")
+        print("💡 Please install cryptography (pip install cryptography) or OpenSSL (brew install openssl)")
+        return False
 
 def create_ssl_cert():
-    """Create self-signed SSL certificate using openssl"""
+    """Create self-signed SSL certificate, reusing one that is still valid"""
+    global _cert_cache
     cert_file = 'server.pem'
     key_file = 'server.key'
     
-    if os.path.exists(cert_file) and os.path.exists(key_file):
-        print("✅ SSL certificate already exists")
-        return cert_file, key_file
+    if _cert_cache and _cert_cache[2] - datetime.now(timezone.utc) > CERT_MIN_VALIDITY:
+        return _cert_cache[0], _cert_cache[1]
+    
+    try:
+        os.stat(cert_file)
+        os.stat(key_file)
+        not_after = _cert_not_after(cert_file)
+        if not_after - datetime.now(timezone.utc) > CERT_MIN_VALIDITY:
+            print("✅ SSL certificate already exists")
+            _cert_cache = (cert_file, key_file, not_after)
+            return cert_file, key_file
+        print("⚠️  SSL certificate is expiring, regenerating...")
+    except FileNotFoundError:
+        pass
     
     print("🔐 Creating self-signed SSL certificate...")
     try:
-        # Create private key and certificate
-        subprocess.run([
-            'openssl', 'req', '-new', '-x509', '-keyout', key_file, 
-            '-out', cert_file, '-days', '365', '-nodes',
-            '-subj', '/C=US/ST=CA/L=SF/O=AR/CN=localhost'
-        ], check=True, capture_output=True)
+        from cryptography import x509
+        from cryptography.x509.oid import NameOID
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+    except ImportError:
+        print("⚠️  cryptography library not found, using openssl...")
+        if not _create_ssl_cert_openssl(cert_file, key_file):
+            return None, None
         print("✅ SSL certificate created successfully")
+        _cert_cache = (cert_file, key_file, datetime.now(timezone.utc) + timedelta(days=365))
         return cert_file, key_file
-    except subprocess.CalledProcessError as e:
+    
+    try:
+        # ECDSA P-256: fast keygen, accepted by all browsers
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([
+            x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
+            x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "CA"),
+            x509.NameAttribute(NameOID.LOCALITY_NAME, "SF"),
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, "AR"),
+            x509.NameAttribute(NameOID.COMMON_NAME, "localhost"),
+        ])
+        now = datetime.now(timezone.utc)
+        not_after = now + timedelta(days=365)
+        cert = x509.CertificateBuilder().subject_name(
+            name
+        ).issuer_name(
+            name
+        ).public_key(
+            private_key.public_key()
+        ).serial_number(
+            x509.random_serial_number()
+        ).not_valid_before(
+            now
+        ).not_valid_after(
+            not_after
+        ).add_extension(
+            x509.SubjectAlternativeName([x509.DNSName("localhost")]),
+            critical=False,
+        ).sign(private_key, hashes.SHA256())
+        
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            ))
+        with open(cert_file, 'wb') as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        
+        print("✅ SSL certificate created successfully")
+        _cert_cache = (cert_file, key_file, not_after)
+        return cert_file, key_file
+    except OSError as e:
         print(f"❌ Failed to create SSL certificate: {e}")
-        print("💡 Please install OpenSSL: brew install openssl")
-        return None, None
-    except FileNotFoundError:
-        print("❌ OpenSSL not found")
-        print("💡 Please install OpenSSL: brew install openssl")
         return None, None
 
 def main():
     # Change to the directory containing this script
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(SCRIPT_DIR)
     
     print(f"🚀 AR Game HTTPS Server starting...")
-    print(f"🔍 Checking port {PORT}...")
-    
-    # Kill any existing processes on port 8443
-    kill_port_processes(PORT)
     
     # Create SSL certificate
     cert_file, key_file = create_ssl_cert()
@@ -114,61 +150,47 @@ def main():
         print("❌ Cannot start HTTPS server without SSL certificate")
         print("💡 Falling back to HTTP server on port 8000...")
         fallback_port = 8000
-        kill_port_processes(fallback_port)
         
         try:
-            with socketserver.TCPServer(("0.0.0.0", fallback_port), MyHTTPRequestHandler) as httpd:
-                print(f"✅ HTTP Server started!")
-                print(f"📱 Server running at: http://localhost:{fallback_port}")
-                print(f"📱 Mobile access: http://[YOUR_IP]:{fallback_port}")
-                print(f"⚠️  Note: Some features may not work without HTTPS")
-                print(f"⏹️  Press Ctrl+C to stop the server")
-                print("-" * 50)
-                
-                try:
-                    webbrowser.open(f'http://localhost:{fallback_port}')
-                    print("🌐 Browser opened automatically")
-                except:
-                    print("⚠️  Could not open browser automatically")
-                
-                httpd.serve_forever()
+            banner = [
+                f"✅ HTTP Server started!",
+                f"📱 Server running at: http://localhost:{fallback_port}",
+                f"📱 Mobile access: http://[YOUR_IP]:{fallback_port}",
+                f"⚠️  Note: Some features may not work without HTTPS",
+                f"⏹️  Press Ctrl+C to stop the server",
+                "-" * 50
+            ]
+            # Prefer the event-loop server for many concurrent connections; the http.server
+            # fallback is the tuned path (in-memory cache, sendfile, TLS session tickets)
+            if not serve_asgi(fallback_port, banner):
+                run_server(fallback_port, banner=banner)
+        except KeyboardInterrupt:
+            print("\n🛑 Server stopped by user")
         except OSError as e:
             print(f"❌ Error starting HTTP server: {e}")
             sys.exit(1)
         return
     
     try:
-        with socketserver.TCPServer(("0.0.0.0", PORT), MyHTTPRequestHandler) as httpd:
-            # Create SSL context
-            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-            context.load_cert_chain(cert_file, key_file)
-            
-            # Wrap socket with SSL
-            httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
-            
-            print(f"✅ HTTPS Server started successfully!")
-            print(f"📱 Server running at: https://localhost:{PORT}")
-            print(f"📱 Mobile access: https://[YOUR_IP]:{PORT}")
-            print(f"🎯 Open your browser and go to: https://localhost:{PORT}")
-            print(f"🔒 HTTPS enabled for device sensor access!")
-            print(f"⚠️  Browser will show security warning - click 'Advanced' and 'Proceed'")
-            print(f"⏹️  Press Ctrl+C to stop the server")
-            print("-" * 50)
-            
-            # Try to open browser automatically
-            try:
-                webbrowser.open(f'https://localhost:{PORT}')
-                print("🌐 Browser opened automatically")
-            except:
-                print("⚠️  Could not open browser automatically")
-            
-            httpd.serve_forever()
-            
+        banner = [
+            f"✅ HTTPS Server started successfully!",
+            f"📱 Server running at: https://localhost:{PORT}",
+            f"📱 Mobile access: https://[YOUR_IP]:{PORT}",
+            f"🎯 Open your browser and go to: https://localhost:{PORT}",
+            f"🔒 HTTPS enabled for device sensor access!",
+            f"⚠️  Browser will show security warning - click 'Advanced' and 'Proceed'",
+            f"⏹️  Press Ctrl+C to stop the server",
+            "-" * 50
+        ]
+        # Prefer the event-loop server for many concurrent connections; the http.server
+        # fallback is the tuned path (in-memory cache, sendfile, TLS session tickets)
+        if not serve_asgi(PORT, banner, cert_file, key_file):
+            run_server(PORT, create_ssl_context(cert_file, key_file), banner=banner)
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")
         sys.exit(0)
     except OSError as e:
-        if e.errno == 48:  # Address already in use
+        if e.errno == errno.EADDRINUSE:  # Address already in use
             print(f"❌ Port {PORT} is still in use after cleanup attempt.")
             print("💡 Try running: python3 -m http.server 8444")
             print("💡 Or manually kill processes: sudo lsof -ti :8443 | xargs kill -9")